@@ -23,6 +23,8 @@ class Agent(object):
         self.name = name
         # Uninitialized player - will be set upon starting a Game
         self.player = 0
+        # Time limit for a move in seconds - will be set upon starting a timed Game
+        self.time_limit = None
 
     # Pick a column.
     #
@@ -32,6 +34,21 @@ class Agent(object):
         """Returns a column between 0 and (brd.w-1). The column must be free in the board."""
         raise NotImplementedError("Please implement this method")
 
+    # Be told about a move played in the game, by either player.
+    #
+    # PARAM [int] x:      the column where the token was added
+    # PARAM [int] player: the player who added the token [1|2]
+    def move_played(self, x, player):
+        """Called by the Game after every legal move. Does nothing by default."""
+        pass
+
+    # Be told that the game is over.
+    #
+    # PARAM [int] outcome: 1 for Player 1, 2 for Player 2, and 0 for no winner
+    def game_over(self, outcome):
+        """Called by the Game when the game ends. Does nothing by default."""
+        pass
+
 
 
 ##########################
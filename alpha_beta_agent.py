@@ -1,5 +1,26 @@
+import atexit
+import multiprocessing
+import os
+import queue
+import time
+from multiprocessing import shared_memory
 import agent
-import board
+import endgame
+import evaluator
+import opening_book
+import transposition
+
+# Score of a win. A win found at search depth d scores WIN_SCORE - d, so
+# that sooner wins score higher; losses score the opposite.
+WIN_SCORE = 1000000
+# Deeper than any search can go, so that every proven win or loss scores at
+# least WIN_SCORE - MAX_PLY, far above any heuristic score
+MAX_PLY = 1000
+
+# Raised inside the search when the time budget of a move is used up
+class SearchTimeout(Exception):
+    """The search ran out of time"""
+    pass
 
 ###########################
 # Alpha-Beta Search Agent #
@@ -10,13 +31,131 @@ class AlphaBetaAgent(agent.Agent):
 
     # Class constructor.
     #
-    # PARAM [string] name:      the name of this player
-    # PARAM [int]    max_depth: the maximum search depth
-    def __init__(self, name, max_depth):
+    # PARAM [string] name:          the name of this player
+    # PARAM [int]    max_depth:     the maximum search depth
+    # PARAM [int]    tt_size:       the transposition table budget in bytes (0 to disable)
+    # PARAM [bool]   iterative:     if True, search depth 2, 3, ... up to max_depth
+    #                               (None for no limit) while time allows
+    # PARAM [float]  time_limit:    the time limit for a move in seconds, if
+    #                               not given by the Game
+    # PARAM [float]  time_fraction: the fraction of the time limit that
+    #                               iterative deepening may use
+    # PARAM [bool]   move_ordering: if True, reorder moves with killer moves and
+    #                               the history heuristic
+    # PARAM [bool]   verbose:       if True, print search statistics after each move
+    # PARAM [string] search:        the search algorithm: "alphabeta", "pvs"
+    #                               (principal variation search) or "mtdf"
+    # PARAM [float]  aspiration:    the half-width of the root window around the
+    #                               previous iteration's value (None to disable)
+    # PARAM [int]    workers:       the number of processes searching together in
+    #                               iterative mode (Lazy SMP), sharing the
+    #                               transposition table
+    # PARAM [bool]   ponder:        if True, keep searching the likely replies in
+    #                               helper processes while the opponent thinks
+    # PARAM [int]    endgame_cells: solve the game exactly when at most this
+    #                               many cells are empty (0 to disable)
+    # PARAM [int]    endgame_nodes: also solve it exactly when the estimated
+    #                               game tree has at most this many nodes
+    # PARAM [string] book:          the opening book file to look positions up
+    #                               in before searching (None to disable)
+    # PARAM [bool]   lmr:           if True, search late moves with a reduced
+    #                               depth first (late move reductions)
+    # PARAM [int]    lmr_moves:     the number of moves searched at full depth
+    #                               before reducing
+    # PARAM [int]    lmr_depth:     the minimum remaining depth for reducing
+    # PARAM [int]    lmr_reduction: the depth taken off a late move
+    def __init__(self, name, max_depth, tt_size=1 << 24, iterative=False,
+                 time_limit=None, time_fraction=0.5, move_ordering=True,
+                 verbose=False, search="alphabeta", aspiration=None,
+                 workers=1, ponder=False, endgame_cells=12, endgame_nodes=50000,
+                 book=None, lmr=False, lmr_moves=3, lmr_depth=3, lmr_reduction=1):
         super().__init__(name)
         # Max search depth
         self.max_depth = max_depth
+        # Depth of the current search iteration, and of the last completed one
+        self.depth_limit = max_depth
+        self.completed_depth = 0
         self.col_order = None
+        # Iterative deepening settings
+        self.iterative = iterative
+        self.time_limit = time_limit
+        self.time_fraction = time_fraction
+        # Time (on the time.monotonic() clock, which all processes share)
+        # after which the search is aborted, None for no limit
+        self.deadline = None
+        # Event telling the search to stop early; only set in helper processes
+        self.stop_event = None
+        # Nodes visited by the current search
+        self.nodes = 0
+        # Best move of the last completed iteration, searched first
+        self.best_move = None
+        # Move ordering: two killer moves per depth, and a history score
+        # indexed by player, column and row
+        self.move_ordering = move_ordering
+        self.killers = []
+        self.history = None
+        # Beta cutoffs, and how many of them were caused by the first move tried
+        self.cutoffs = 0
+        self.first_cutoffs = 0
+        self.verbose = verbose
+        # Search algorithm and root window settings
+        if search not in ("alphabeta", "pvs", "mtdf"):
+            raise ValueError("Unknown search algorithm: {}".format(search))
+        self.search = search
+        self.aspiration = aspiration
+        # Late move reduction settings; a reduced move must still be searched
+        # at least one ply deep, and after a first move has set alpha
+        if lmr_reduction >= lmr_depth:
+            raise ValueError("lmr_reduction must be smaller than lmr_depth")
+        if lmr_moves < 1:
+            raise ValueError("lmr_moves must be at least 1")
+        self.lmr = lmr
+        self.lmr_moves = lmr_moves
+        self.lmr_depth = lmr_depth
+        self.lmr_reduction = lmr_reduction
+        # Reduced searches, and how many of them had to be searched again
+        self.reductions = 0
+        self.researches = 0
+        # Heuristic score of the searched board, kept up to date move by move
+        self.evaluator = None
+        # Transposition table, kept across moves of the same game
+        self.tt_size = tt_size
+        self.tt = None
+        if tt_size > 0:
+            self.tt = transposition.TranspositionTable(tt_size)
+        # False if the table is managed by another process
+        self.tt_owner = True
+        # Lazy SMP helper processes, started on the first parallel search
+        self.workers = workers
+        self.smp_procs = []
+        self.smp_jobs = []
+        # The job queues of the pondering helpers, which run niced
+        self.ponder_jobs = []
+        # The number of helpers the current job was sent to
+        self.smp_busy = 0
+        self.smp_results = None
+        self.smp_stop = None
+        self.smp_job = 0
+        self.shm = None
+        # Pondering settings, and whether the helpers are pondering right now
+        self.ponder = ponder and tt_size > 0
+        self.pondering = False
+        # Shape and token count of the last board searched, to detect a new game
+        self.last_shape = None
+        self.last_tokens = 0
+        # Exact endgame solver, and when to switch to it
+        self.endgame_cells = endgame_cells
+        self.endgame_nodes = endgame_nodes
+        self.solver = None
+        if endgame_cells > 0 or endgame_nodes > 0:
+            self.solver = endgame.EndgameSolver()
+        # Result of the last solved position (endgame.WIN, DRAW or LOSS), None if not solved
+        self.solved = None
+        # True if the last move was an immediate win or a forced block
+        self.forced = False
+        # Opening book file, mapped on the first move
+        self.book_path = book
+        self.book = None
 
     # Calculates the column order given the board width, and memoizes the result.
     # PARAM [int] width: The board width
@@ -42,13 +181,463 @@ class AlphaBetaAgent(agent.Agent):
     # NOTE: make sure the column is legal, or you'll lose the game.
     def go(self, brd):
         """Search for the best move (choice of column for the token)"""
+        # The search plays moves on the board, so it needs a board of its own
+        brd = brd.copy()
+        self.stop_pondering()
         self.cache_col_order(brd.w)
+        self.prepare_search(brd)
+
+        self.deadline = None
+        if self.iterative and self.time_limit is not None:
+            self.deadline = time.monotonic() + self.time_limit * self.time_fraction
+        searched = False
+        action = self.forced_move(brd)
+        if action is None:
+            action = self.book_move(brd)
+        if action is None:
+            action = self.solve_endgame(brd)
+        if action is None:
+            searched = True
+            if not self.iterative:
+                # Negamax
+                self.depth_limit = self.max_depth
+                v, action = self.search_root(brd, None)
+                self.completed_depth = self.max_depth
+            elif self.workers > 1 and self.tt is not None:
+                action = self.parallel_search(brd)
+            else:
+                action = self.iterative_deepening(brd)
+
+        if self.verbose:
+            if searched:
+                print("{}: depth {}, {} nodes, {:.0%} of cutoffs on the first move".format(
+                    self.name, self.completed_depth, self.nodes, self.cutoff_rate()))
+                if self.lmr:
+                    print("{}: {} reduced searches, {} searched again".format(
+                        self.name, self.reductions, self.researches))
+            elif self.forced:
+                print("{}: forced move".format(self.name))
+            elif self.solved is not None:
+                print("{}: solved ({}), {} nodes".format(
+                    self.name, "win" if self.solved == endgame.WIN else "draw",
+                    self.solver.nodes))
+            else:
+                print("{}: book move".format(self.name))
+        if self.ponder:
+            self.start_pondering(brd, action)
+        return action
 
-        # Negamax
-        v, action = self.negamax(brd, float('-inf'), float('inf'), None, 1, brd.player)
+    # Find a move that needs no search: a winning column, or the column that
+    # blocks the opponent's win.
+    #
+    # PARAM [board.Board] brd: the current board state
+    # RETURN [int]: the forced column, or None if the position needs a search
+    #
+    # NOTE: Against a double threat every move loses, so the first block is
+    #       as good as any.
+    def forced_move(self, brd):
+        """Returns the immediate win or forced block, or None"""
+        wins = brd.winning_cols(brd.player)
+        if wins:
+            self.forced = True
+            return wins[0]
+        blocks = brd.winning_cols(3 - brd.player)
+        if blocks:
+            self.forced = True
+            return blocks[0]
+        return None
+
+    # Look the position up in the opening book.
+    #
+    # PARAM [board.Board] brd: the current board state
+    # RETURN [int]: the book move, or None if the position is not in the book
+    def book_move(self, brd):
+        """Returns the opening book move for the position, or None"""
+        if self.book_path is None:
+            return None
+        if self.book is None:
+            self.book = opening_book.OpeningBook(self.book_path)
+        return self.book.lookup(brd)
+
+    # Solve the position exactly if the game is close enough to its end.
+    #
+    # PARAM [board.Board] brd: the current board state
+    # RETURN [int]: the column to play if the position is a win or a draw, or
+    #               None to fall back to the heuristic search
+    #
+    # NOTE: A lost position is left to the heuristic search, which picks the
+    #       move that delays the loss the most. The solver gets half of the
+    #       time budget, so the search still has time if it gives up.
+    def solve_endgame(self, brd):
+        """Returns the exact best move near the end of the game, or None"""
+        if self.solver is None:
+            return None
+        empty = brd.w * brd.h - sum(brd.heights)
+        cols = len(brd.free_cols())
+        if empty > self.endgame_cells and cols ** ((empty + 1) // 2) > self.endgame_nodes:
+            return None
+        deadline = None
+        if self.deadline is not None:
+            deadline = time.monotonic() + (self.deadline - time.monotonic()) / 2
+        try:
+            self.solved, action = self.solver.solve(brd, deadline)
+        except endgame.SolverTimeout:
+            return None
+        if self.solved == endgame.LOSS:
+            return None
+        return action
 
+    # Be told about a move played in the game. Once the opponent has moved,
+    # pondering is over.
+    #
+    # PARAM [int] x: the column where the token was added
+    # PARAM [int] player: the player who added the token [1|2]
+    def move_played(self, x, player):
+        if player != self.player:
+            self.stop_pondering()
+
+    # Be told that the game is over.
+    #
+    # PARAM [int] outcome: 1 for Player 1, 2 for Player 2, and 0 for no winner
+    def game_over(self, outcome):
+        self.stop_pondering()
+
+    # Search the opponent's likely replies in the helper processes, filling
+    # the shared transposition table for the next call to go().
+    #
+    # The replies are searched as roots one move further into the game, which
+    # is exactly the depth of the next search, so their entries keep their full
+    # value once the opponent has moved.
+    #
+    # Each helper gets twice the time limit, shared between the replies.
+    #
+    # PARAM [board.Board] brd: the board searched by go()
+    # PARAM [int] action: the move go() picked
+    def start_pondering(self, brd, action):
+        """Starts searching the positions after each likely reply in the background"""
+        nb = brd.copy()
+        nb.play(action)
+        if nb.get_outcome() != 0 or not nb.free_cols():
+            return
+        self.start_workers()
+        # Predicted reply first: the best move stored for the position, if any
+        replies = self.get_moves(nb)
+        entry = self.tt.probe(nb.key())
+        if entry is not None and entry[3] in replies:
+            replies.remove(entry[3])
+            replies.insert(0, entry[3])
+        roots = []
+        for reply in replies:
+            root = nb.copy()
+            root.play(reply)
+            if root.get_outcome() == 0 and root.free_cols():
+                roots.append(root)
+        if not roots:
+            return
+        deadline = None
+        if self.time_limit is not None:
+            deadline = time.monotonic() + 2 * self.time_limit
+        self.smp_job += 1
+        self.smp_stop.clear()
+        self.smp_busy = len(self.ponder_jobs)
+        for k, jobs in enumerate(self.ponder_jobs):
+            # Every helper starts on a different reply, then goes on with the others
+            first = k % len(roots)
+            jobs.put((self.smp_job, roots[first:] + roots[:first], sum(nb.heights) + 1, deadline))
+        self.pondering = True
+
+    # Stop pondering and wait until the helpers are idle, so that they do not
+    # take CPU time away from the next timed move.
+    def stop_pondering(self):
+        """Stops the background search started by start_pondering()"""
+        if not self.pondering:
+            return
+        self.pondering = False
+        self.wait_workers()
+
+    # Get the fraction of beta cutoffs caused by the first move tried.
+    #
+    # RETURN [float]: the first-move cutoff rate of the last search
+    def cutoff_rate(self):
+        """Returns the fraction of cutoffs that happened on the first move"""
+        if self.cutoffs == 0:
+            return 0.0
+        return self.first_cutoffs / self.cutoffs
+
+    # Search the root position with the configured algorithm.
+    #
+    # PARAM [board.Board] brd: the current board state
+    # PARAM [float] guess: the value of the previous iteration, or None
+    # RETURN [(float, int)]: the value of the position and the best move
+    def search_root(self, brd, guess):
+        """Runs one search of the root to the current depth limit"""
+        inf = float('inf')
+        if self.search == "mtdf":
+            return self.mtdf(brd, 0 if guess is None else guess)
+        # Aspiration window; win scores are too far apart to aim at
+        if self.aspiration is not None and guess is not None and abs(guess) < WIN_SCORE - MAX_PLY:
+            lo = guess - self.aspiration
+            hi = guess + self.aspiration
+            v, action = self.negamax(brd, lo, hi, None, 1, brd.player)
+            if lo < v < hi:
+                return v, action
+        # Full window, or re-search after the value fell outside the aspiration window
+        return self.negamax(brd, -inf, inf, None, 1, brd.player)
+
+    # Find the value of the root with a series of null-window searches (MTD(f)).
+    #
+    # PARAM [board.Board] brd: the current board state
+    # PARAM [float] guess: the first guess of the value
+    # RETURN [(float, int)]: the value of the position and the best move
+    def mtdf(self, brd, guess):
+        """Converges on the root value by null-window searches around a guess"""
+        g = guess
+        lower = float('-inf')
+        upper = float('inf')
+        action = None
+        while lower < upper:
+            beta = g + 1 if g == lower else g
+            g, move = self.negamax(brd, beta - 1, beta, None, 1, brd.player)
+            if g < beta:
+                upper = g
+            else:
+                # Only a fail high proves the move reaches the value
+                lower = g
+                action = move
+        return g, action
+
+    # Search deeper and deeper until the deadline.
+    #
+    # PARAM [board.Board] brd: the current board state
+    # PARAM [int] first_depth: the depth of the first iteration
+    # RETURN [int]: the best move of the deepest completed iteration
+    def iterative_deepening(self, brd, first_depth=2):
+        """Runs negamax with increasing depth, keeping the last complete result"""
+        # No point searching past a full board
+        empty = brd.w * brd.h - sum(brd.heights)
+        last_depth = empty + 1
+        if self.max_depth is not None:
+            last_depth = min(last_depth, self.max_depth)
+        # Fallback if not even the first iteration completes
+        action = self.get_moves(brd)[0]
+        root_moves = len(brd.moves)
+        v = None
+        for depth in range(first_depth, last_depth + 1):
+            self.depth_limit = depth
+            try:
+                v, action = self.search_root(brd, v)
+            except SearchTimeout:
+                # Take back the moves of the aborted iteration
+                while len(brd.moves) > root_moves:
+                    self.undo_move(brd)
+                break
+            self.best_move = action
+            self.completed_depth = depth
+            # Stop once a win or a loss is certain
+            if abs(v) >= WIN_SCORE - MAX_PLY:
+                break
+        return self.best_move if self.best_move is not None else action
+
+    # Search with helper processes (Lazy SMP). Every process runs its own
+    # iterative deepening on the same position, half of the helpers starting
+    # one depth deeper, and they all share the transposition table. The move
+    # of the deepest completed iteration wins.
+    #
+    # PARAM [board.Board] brd: the current board state
+    # RETURN [int]: the best move found
+    def parallel_search(self, brd):
+        """Runs iterative deepening in several processes at once"""
+        self.start_workers()
+        self.smp_job += 1
+        self.smp_stop.clear()
+        self.smp_busy = len(self.smp_jobs)
+        for jobs in self.smp_jobs:
+            # Send copies: queued objects are pickled later, by another thread
+            jobs.put((self.smp_job, [brd.copy()], self.tt.generation, self.deadline))
+        action = self.iterative_deepening(brd)
+        depth = self.completed_depth
+        for w_depth, w_action in self.wait_workers():
+            if w_depth > depth:
+                depth = w_depth
+                action = w_action
+        self.completed_depth = depth
         return action
 
+    # Stop the helpers and wait until they are idle.
+    #
+    # RETURN [list of (int, int)]: the completed depth and best move of each
+    #                              helper for the current job
+    def wait_workers(self):
+        """Stops the current helper job and collects its results"""
+        self.smp_stop.set()
+        results = []
+        while len(results) < self.smp_busy:
+            try:
+                job, w_depth, w_action = self.smp_results.get(timeout=5)
+            except queue.Empty:
+                break
+            if job == self.smp_job:
+                results.append((w_depth, w_action))
+        return results
+
+    # Start the helper processes, for Lazy SMP and pondering, and move the
+    # transposition table to shared memory. The pondering helpers are separate
+    # processes, so that only they run niced.
+    def start_workers(self):
+        """Starts the helper processes, if not running yet"""
+        if self.smp_procs:
+            return
+        self.tt.release()
+        self.shm = shared_memory.SharedMemory(
+            create=True, size=transposition.TranspositionTable.buffer_size(self.tt_size))
+        self.tt = transposition.TranspositionTable(self.tt_size, self.shm.buf)
+        self.tt.clear()
+        self.smp_stop = multiprocessing.Event()
+        self.smp_results = multiprocessing.Queue()
+        settings = {
+            "max_depth": self.max_depth,
+            "move_ordering": self.move_ordering,
+            "search": self.search,
+            "aspiration": self.aspiration,
+            "lmr": self.lmr,
+            "lmr_moves": self.lmr_moves,
+            "lmr_depth": self.lmr_depth,
+            "lmr_reduction": self.lmr_reduction,
+        }
+        atexit.register(self.close)
+        try:
+            helpers = self.workers - 1
+            ponder_helpers = max(helpers, 1) if self.ponder else 0
+            for k in range(1, helpers + ponder_helpers + 1):
+                niced = k > helpers
+                jobs = multiprocessing.Queue()
+                proc = multiprocessing.Process(
+                    target=smp_worker, daemon=True,
+                    args=(k, self.shm.name, self.tt_size, settings, jobs,
+                          self.smp_results, self.smp_stop, niced))
+                proc.start()
+                if niced:
+                    self.ponder_jobs.append(jobs)
+                else:
+                    self.smp_jobs.append(jobs)
+                self.smp_procs.append(proc)
+        except BaseException:
+            # Do not leave the shared memory behind if a helper cannot start
+            self.close()
+            raise
+
+    # Stop the Lazy SMP helper processes and free the shared memory.
+    def close(self):
+        """Stops the helper processes"""
+        self.stop_pondering()
+        if self.shm is None:
+            return
+        for jobs in self.smp_jobs + self.ponder_jobs:
+            jobs.put(None)
+        for proc in self.smp_procs:
+            proc.join(1)
+            if proc.is_alive():
+                proc.terminate()
+        self.smp_procs = []
+        self.smp_jobs = []
+        self.ponder_jobs = []
+        # Go back to a private table
+        self.tt.release()
+        self.tt = transposition.TranspositionTable(self.tt_size)
+        self.shm.close()
+        self.shm.unlink()
+        self.shm = None
+        self.smp_stop = None
+
+    # Prepares the transposition table and move ordering tables for a new
+    # search, emptying them if the board comes from a new game.
+    # PARAM [board.Board] brd: the board about to be searched
+    def prepare_search(self, brd):
+        self.nodes = 0
+        self.cutoffs = 0
+        self.first_cutoffs = 0
+        self.reductions = 0
+        self.researches = 0
+        self.solved = None
+        self.forced = False
+        self.best_move = None
+        self.completed_depth = 0
+        shape = (brd.w, brd.h, brd.n)
+        tokens = sum(brd.heights)
+        if shape != self.last_shape or tokens < self.last_tokens:
+            if self.tt is not None and self.tt_owner:
+                self.tt.clear()
+            self.history = [[[0] * brd.h for x in range(brd.w)] for p in range(3)]
+        else:
+            # Age the history, so that recent cutoffs weigh more
+            for p in self.history:
+                for col in p:
+                    for y in range(len(col)):
+                        col[y] >>= 1
+        self.last_shape = shape
+        self.last_tokens = tokens
+        self.killers = []
+        if self.tt is not None and self.tt_owner:
+            # Win scores depend on the distance to the root, so entries are
+            # only comparable between searches from the same number of tokens
+            self.tt.new_search(tokens)
+        self.evaluator = evaluator.IncrementalEvaluator(brd)
+
+    # Play a move on the searched board and update the heuristic score.
+    # PARAM [board.Board] brd: the board being searched
+    # PARAM [int] col: the column to play
+    def play_move(self, brd, col):
+        y = brd.play(col)
+        self.evaluator.play(col, y, brd.board[y][col])
+
+    # Take back the last move played on the searched board.
+    # PARAM [board.Board] brd: the board being searched
+    def undo_move(self, brd):
+        col = brd.moves[-1][0]
+        brd.undo()
+        self.evaluator.undo(col, brd.heights[col])
+
+    # Order the moves of a node: the given first move, then the killer moves
+    # of this depth, then by history score. Ties keep the middle-first order.
+    # PARAM [board.Board] brd: the board state
+    # PARAM [list of int] moves: the legal moves, middle first
+    # PARAM [int] depth: the depth of the node
+    # PARAM [int] player: the player to move
+    # PARAM [int] first: the move to try first (transposition table or
+    #                    previous iteration), or None
+    # RETURN [list of int]: the moves in the order they should be searched
+    def order_moves(self, brd, moves, depth, player, first):
+        """Returns the moves sorted by how likely they are to cause a cutoff"""
+        if self.move_ordering:
+            history = self.history[player]
+            heights = brd.heights
+            moves.sort(key=lambda x: -history[x][heights[x]])
+            if depth < len(self.killers):
+                for k in reversed(self.killers[depth]):
+                    if k in moves:
+                        moves.remove(k)
+                        moves.insert(0, k)
+        if first is not None and first in moves:
+            moves.remove(first)
+            moves.insert(0, first)
+        return moves
+
+    # Remember a move that caused a beta cutoff.
+    # PARAM [board.Board] brd: the board state, before the move is played
+    # PARAM [int] col: the move that caused the cutoff
+    # PARAM [int] depth: the depth of the node
+    # PARAM [int] player: the player to move
+    def record_cutoff(self, brd, col, depth, player):
+        """Updates the killer moves and the history table"""
+        remaining = self.depth_limit - depth
+        self.history[player][col][brd.heights[col]] += remaining * remaining
+        while len(self.killers) <= depth:
+            self.killers.append([None, None])
+        killers = self.killers[depth]
+        if killers[0] != col:
+            killers[1] = killers[0]
+            killers[0] = col
+
     # Gets the score of a non-terminal board.
      # PARAM [board.Board] board: The current state of the board.
      # PARAM [int] player: The value of a player's token. [1|2]
@@ -58,11 +647,44 @@ class AlphaBetaAgent(agent.Agent):
         """Caluclate a score for the entire board. """
 
         # calc for both you and oponent
-        sum = 0
-        sum += self.count_all(board, player)
-        sum -= self.count_all(board, other)
+        scores = self.count_windows(board)
+        return scores[player] - scores[other]
 
-        return sum
+    # Gets the score of all tokens on the board for both players, going
+    # through the winning windows once.
+    #
+    # Looking from a token at the n-1 cells in one direction is looking at a
+    # window from one of its ends. If the window holds k of the player's
+    # tokens and none of the opponent's, it scores 2*(k-1) + (n-k) = k+n-2
+    # for each end holding one of the player's tokens, and 0 otherwise.
+    #
+    # PARAM [board.Board] board: The current state of the board.
+    # RETURN [list of int]: Summed score of the tokens of each player, indexed by player.
+    def count_windows(self, board):
+        """ Get the sum of all tokens on the board, for both players """
+        n = board.n
+        cells = board.windows.cells
+        flat = [t for row in board.board for t in row]
+        scores = [0, 0, 0]
+        for start in range(0, len(cells), n):
+            c1 = 0
+            c2 = 0
+            for i in range(start, start + n):
+                t = flat[cells[i]]
+                if t == 1:
+                    c1 += 1
+                elif t == 2:
+                    c2 += 1
+            # Windows with both players' tokens count for nobody
+            if c1 and c2:
+                continue
+            first = flat[cells[start]]
+            last = flat[cells[start + n - 1]]
+            if c1:
+                scores[1] += ((first == 1) + (last == 1)) * (c1 + n - 2)
+            elif c2:
+                scores[2] += ((first == 2) + (last == 2)) * (c2 + n - 2)
+        return scores
 
     # Gets the score of all tokens on the board.
      # PARAM [board.Board] board: The current state of the board.
@@ -70,16 +692,7 @@ class AlphaBetaAgent(agent.Agent):
      # RETURN [int]: Summed score for tokens t on the board.
     def count_all(self, board, t):
         """ Get the sum of all tokens on the board """
-
-        sum = 0
-        # Go through all spaces on the board
-        for i in range(board.h):
-            for j in range(board.w):
-                # only eval for the specified token
-                if(board.board[i][j] == t):
-                    sum += self.tokenScore(board, j, i, t)
-
-        return sum
+        return self.count_windows(board)[t]
 
     # Gets the score of a token in all directions.
      # PARAM [board.Board] board: The current state of the board.
@@ -139,75 +752,203 @@ class AlphaBetaAgent(agent.Agent):
         return sum
 
     # Calculates the optimal move and value of the given board for the given player.
+    # The search plays and takes back moves on the given board, which is left
+    # unchanged when the method returns.
     # PARAM [board.Board] board: The board state to check.
     # PARAM [int] a: The alpha value for pruning
     # PARAM [int] b: The beta value for pruning
     # PARAM [int] old_action: The column played to reach this board state
     # PARAM [int] player: The player to run the search for [1|2]
-    def negamax(self, board, a, b, old_action, depth, player):
+    # PARAM [int] limit: The depth of the horizon of this subtree, None for
+    #                    depth_limit; late move reductions bring it closer
+    def negamax(self, board, a, b, old_action, depth, player, limit=None):
+        if limit is None:
+            limit = self.depth_limit
         # Cache board outcome, since get_outcome is somewhat expensive to calculate.
         winner = board.get_outcome()
         other_player = (player % 2) + 1
-        successors = self.get_successors(board)
+        moves = self.get_moves(board)
 
         # Immediate win or loss is calculated here to avoid recomputing outcome.
         # It could also be done in get_board_score.
 
         # Check for immediate win
         if winner == player:
-            return 1000000 / depth, old_action
+            return WIN_SCORE - depth, old_action
         # Check for immediate loss
         if winner == other_player:
-            return -1000000 / depth, old_action
+            return -(WIN_SCORE - depth), old_action
         # Max depth, or no successors (tie)
-        if depth == self.max_depth or len(successors) == 0:
-            return self.get_board_score(board, player, other_player), old_action
+        if len(moves) == 0:
+            return self.evaluator.score(player), old_action
+        # No line can be made anymore: a draw, below the root that must
+        # come up with a move
+        if depth > 1 and self.evaluator.is_dead():
+            return 0, old_action
+
+        # Check the clock every now and then
+        self.nodes += 1
+        if self.nodes & 1023 == 0:
+            if self.deadline is not None and time.monotonic() > self.deadline:
+                raise SearchTimeout()
+            if self.stop_event is not None and self.stop_event.is_set():
+                raise SearchTimeout()
+
+        # Look the position up. Entries from earlier moves only give a best
+        # move to try first, since win scores depend on the distance to the root.
+        key = None
+        first = None
+        if self.tt is not None:
+            key = board.key()
+            entry = self.tt.probe(key)
+            if entry is not None:
+                tt_value, tt_depth, tt_bound, tt_move, tt_gen = entry
+                # The root must always search, to come up with a move
+                if depth > 1 and tt_gen == self.tt.generation and tt_depth >= limit - depth:
+                    if tt_bound == transposition.EXACT:
+                        return tt_value, old_action
+                    if tt_bound == transposition.LOWER:
+                        a = max(a, tt_value)
+                    else:
+                        b = min(b, tt_value)
+                    if a >= b:
+                        return tt_value, old_action
+                first = tt_move
+        # Window actually searched, to know the bound type of the result
+        a0 = a
+
+        if depth >= limit:
+            value = self.evaluator.score(player)
+            if key is not None:
+                self.tt.store(key, value, 0, transposition.EXACT, None)
+            return value, old_action
+
+        # Forced moves: win at once, or block the opponent's winning column
+        if self.evaluator.may_win(player):
+            wins = board.winning_cols(player)
+            if wins:
+                return WIN_SCORE - (depth + 1), wins[0]
+        if self.evaluator.may_win(other_player):
+            blocks = board.winning_cols(other_player)
+            if len(blocks) > 1:
+                # Double threat: the opponent wins next, whatever is played
+                return -(WIN_SCORE - (depth + 2)), blocks[0]
+            if blocks:
+                moves = blocks
+
+        # At the root, the best move of the previous iteration goes first
+        if depth == 1 and self.best_move is not None:
+            first = self.best_move
+        moves = self.order_moves(board, moves, depth, player, first)
 
         # Standard negamax implementation
         value = float('-inf')
         action = None
-        for next_board in self.get_successors(board):
+        # Late move reductions apply to quiet moves far enough from the horizon
+        reduce = self.lmr and len(moves) > self.lmr_moves and limit - depth >= self.lmr_depth
+        threats = self.evaluator.threats
+        for i, col in enumerate(moves):
+            if reduce and i >= self.lmr_moves:
+                mine = threats[player]
+                theirs = threats[other_player]
+            # Search the child in place, then take the move back
+            self.play_move(board, col)
             # It is notable that `nv` is negated every time it is used, this is a key property of negamax.
-            nv, new_action = self.negamax(next_board[0], -b, -a, next_board[1], depth + 1, other_player)
+            full = True
+            if reduce and i >= self.lmr_moves and threats[player] <= mine and threats[other_player] >= theirs:
+                # Late move that neither makes nor blocks a threat: prove it is
+                # no better than the best so far with a shallower null window search
+                self.reductions += 1
+                nv, _ = self.negamax(board, -a - 1, -a, col, depth + 1, other_player,
+                                     limit - self.lmr_reduction)
+                full = -nv > a
+                if full:
+                    self.researches += 1
+            if full and self.search == "pvs" and i > 0:
+                # Null window to prove the move is no better than the best so far
+                nv, _ = self.negamax(board, -a - 1, -a, col, depth + 1, other_player, limit)
+                if a < -nv < b:
+                    # Fail high: the move may be better, search it properly
+                    nv, _ = self.negamax(board, -b, -a, col, depth + 1, other_player, limit)
+            elif full:
+                nv, _ = self.negamax(board, -b, -a, col, depth + 1, other_player, limit)
+            self.undo_move(board)
 
             if -nv > value:
                 value = -nv
-                action = next_board[1]
+                action = col
 
             a = max(a, value)
 
             if a >= b:
-                return value, new_action
-
+                self.cutoffs += 1
+                if i == 0:
+                    self.first_cutoffs += 1
+                self.record_cutoff(board, col, depth, player)
+                if key is not None:
+                    self.tt.store(key, value, limit - depth, transposition.LOWER, col)
+                return value, col
+
+        if key is not None:
+            if value <= a0:
+                bound = transposition.UPPER
+            else:
+                bound = transposition.EXACT
+            self.tt.store(key, value, limit - depth, bound, action)
         return value, action
 
-    # Get the successors of the given board in order of middle outwards.
+    # Get the legal moves of the given board in order of middle outwards.
     # PARAM [board.Board] brd: the board state
-    # RETURN [list of (board.Board, int)]: a list of the successor boards,
-    #                                      along with the column where the last
-    #                                      token was added in it
-    def get_successors(self, brd):
-        """Returns the reachable boards from the given board brd. The return value is a tuple (new board state, column number where last token was added)."""
-        # Get possible actions (middle favoring)
-        freecols = [x for x in self.col_order if brd.board[-1][x] == 0 ]
-
-        # Are there legal actions left?
-        if not freecols:
-            return []
-        
-        # Make a list of the new boards along with the corresponding actions
-        succ = []
-        # print(freecols)
-        for col in freecols:
-            # Clone the original board
-            nb = board.Board([row[:] for row in brd.board], brd.w, brd.h, brd.n)
-            nb.player = brd.player
-
-            # Add a token to the new board
-            # (This internally changes nb.player, check the method definition!)
-            nb.add_token(col)
-            # Add board to list of successors
-            succ.append((nb,col))
-        return succ
-
-THE_AGENT = AlphaBetaAgent("Group20", 6)
+    # RETURN [list of int]: the columns with at least one free slot
+    def get_moves(self, brd):
+        """Returns the columns where a token can be added in the given board brd, middle columns first."""
+        return [x for x in self.col_order if brd.heights[x] < brd.h]
+
+# Main loop of a Lazy SMP helper process.
+#
+# PARAM [int] k: the number of the helper (1 and up)
+# PARAM [string] shm_name: the name of the shared memory holding the transposition table
+# PARAM [int] tt_size: the transposition table budget in bytes
+# PARAM [dict] settings: the AlphaBetaAgent constructor settings of the main agent
+# PARAM [multiprocessing.Queue] jobs: the lists of positions to search, None to quit
+# PARAM [multiprocessing.Queue] results: where (job, depth, move) results are sent
+# PARAM [multiprocessing.Event] stop: set when the main search is over
+# PARAM [bool] niced: if True, run at the lowest priority, so that pondering
+#                     does not slow the opponent down
+def smp_worker(k, shm_name, tt_size, settings, jobs, results, stop, niced):
+    if niced:
+        os.nice(19)
+    shm = shared_memory.SharedMemory(name=shm_name)
+    helper = AlphaBetaAgent("smp{}".format(k), tt_size=0, iterative=True,
+                            endgame_cells=0, endgame_nodes=0, **settings)
+    helper.tt = transposition.TranspositionTable(tt_size, shm.buf)
+    helper.tt_owner = False
+    helper.stop_event = stop
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+        job_id, roots, generation, deadline = job
+        # Search the roots one after the other, reporting on the first one
+        depth = 0
+        action = None
+        for i, brd in enumerate(roots):
+            if stop.is_set():
+                break
+            helper.cache_col_order(brd.w)
+            helper.prepare_search(brd)
+            helper.tt.generation = generation
+            helper.deadline = deadline
+            if deadline is not None:
+                # Share the time left evenly between the roots not searched yet
+                now = time.monotonic()
+                helper.deadline = now + max(deadline - now, 0) / (len(roots) - i)
+            move = helper.iterative_deepening(brd, 2 + k % 2)
+            if action is None:
+                depth = helper.completed_depth
+                action = move
+        results.put((job_id, depth, action))
+    helper.tt.release()
+    shm.close()
+
+THE_AGENT = AlphaBetaAgent("Group20", None, iterative=True, time_limit=15)
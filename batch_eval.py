@@ -0,0 +1,141 @@
+import numpy as np
+
+import windows
+
+#########################
+# Batched Board Scoring #
+#########################
+
+# Settings of the token heuristics of alpha_beta_agent_JLaforest*.py: the
+# starting score and token count of a direction, and the bonus of a full
+# line for the searching player and for the opponent
+JLAFOREST = (0, 0, 10, 50)
+JLAFOREST2 = (2, 1, 10, 500)
+
+# Directions looked at from every token, in the order of tokenScore()
+DIRECTIONS = ((0, 1), (1, 1), (1, 0), (1, -1), (0, -1), (-1, -1), (-1, 0), (-1, 1))
+
+class BatchEvaluator(object):
+    """Scores many boards of one shape at once with NumPy"""
+
+    # Class constructor.
+    #
+    # PARAM [int] w: the board width
+    # PARAM [int] h: the board height
+    # PARAM [int] n: the number of tokens to line up to win
+    #
+    # NOTE: Boards are (N, h, w) arrays in the layout of board.Board.board,
+    #       as built by stack() or batch_playout.PlayoutEngine.
+    def __init__(self, w, h, n):
+        """Class constructor"""
+        self.w = w
+        self.h = h
+        self.n = n
+        table = windows.window_table(w, h, n)
+        # Cells of every window, one row per window, numbered y*w+x
+        self.window_cells = np.array(table.cells, dtype=np.intp).reshape(table.count, n)
+        # Cells seen from every cell in every direction; cells off the board
+        # are numbered w*h, an extra cell holding -1
+        self.rays = np.full((w * h, len(DIRECTIONS), n - 1), w * h, dtype=np.intp)
+        for y in range(h):
+            for x in range(w):
+                for d, (dx, dy) in enumerate(DIRECTIONS):
+                    for i in range(1, n):
+                        cx = x + dx * i
+                        cy = y + dy * i
+                        if 0 <= cx < w and 0 <= cy < h:
+                            self.rays[y * w + x, d, i - 1] = cy * w + cx
+
+    # Get the window scores of a batch of boards.
+    #
+    # PARAM [array] boards: the (N, h, w) boards
+    # RETURN [array]: the (N, 3) summed score of the tokens of each player,
+    #                 indexed by player, as AlphaBetaAgent.count_windows()
+    def window_scores(self, boards):
+        """Returns the window heuristic of both players for every board"""
+        n = self.n
+        flat = np.asarray(boards).reshape(len(boards), -1)
+        tokens = flat[:, self.window_cells]
+        scores = np.zeros((len(boards), 3), dtype=np.int64)
+        for t in (1, 2):
+            mine = (tokens == t).sum(axis=2)
+            theirs = (tokens == 3 - t).sum(axis=2)
+            ends = (tokens[:, :, 0] == t).astype(np.int64) + (tokens[:, :, n - 1] == t)
+            value = np.where((mine > 0) & (theirs == 0), ends * (mine + n - 2), 0)
+            scores[:, t] = value.sum(axis=1)
+        return scores
+
+    # Get the heuristic of a batch of boards, as AlphaBetaAgent.get_board_score().
+    #
+    # PARAM [array] boards: the (N, h, w) boards
+    # PARAM [int]   player: the player to score the boards for [1|2]
+    # RETURN [array]: the (N,) score of the player minus the score of the opponent
+    def board_scores(self, boards, player):
+        """Returns the alpha-beta heuristic of every board for the given player"""
+        scores = self.window_scores(boards)
+        return scores[:, player] - scores[:, 3 - player]
+
+    # Get the token scores of a batch of boards, as count_all() in
+    # alpha_beta_agent_JLaforest*.py.
+    #
+    # PARAM [array] boards:   the (N, h, w) boards
+    # PARAM [int]   t:        the player whose tokens are scored [1|2]
+    # PARAM [int]   my_token: the player the agent searches for [1|2]
+    # PARAM [tuple] variant:  JLAFOREST or JLAFOREST2
+    # RETURN [array]: the (N,) summed score of the tokens of player t
+    def token_scores(self, boards, t, my_token, variant):
+        """Returns the token heuristic of player t for every board"""
+        start, count, mine, theirs = variant
+        flat = np.asarray(boards).reshape(len(boards), -1)
+        # Add the cell off the board
+        off = np.full((len(boards), 1), -1, dtype=flat.dtype)
+        flat = np.concatenate((flat, off), axis=1)
+        seen = flat[:, self.rays]
+        # Walking away from a token, an opposing token is always met before
+        # the edge of the board, since every cell past the edge is off it
+        blocked = (seen == 3 - t).any(axis=3)
+        edge = (seen == -1).any(axis=3)
+        own = (seen == t).sum(axis=3)
+        value = start + 2 * own + (seen == 0).sum(axis=3)
+        if t == my_token:
+            bonus = mine
+        else:
+            bonus = theirs
+        value = value + np.where(own + count == self.n, bonus, 0)
+        value = np.where(blocked, 0, np.where(edge, -1, value))
+        # Only the tokens of player t are scored
+        value = value.sum(axis=2) * (flat[:, :-1] == t)
+        return value.sum(axis=1)
+
+    # Get the heuristic of a batch of boards, as get_board_score() in
+    # alpha_beta_agent_JLaforest*.py.
+    #
+    # PARAM [array] boards:  the (N, h, w) boards
+    # PARAM [int]   t:       the player to score the boards for [1|2]
+    # PARAM [tuple] variant: JLAFOREST or JLAFOREST2
+    # RETURN [array]: the (N,) float score of every board
+    def jlaforest_scores(self, boards, t, variant=JLAFOREST):
+        """Returns the JLaforest heuristic of every board for player t"""
+        return (self.token_scores(boards, t, t, variant) * .75 -
+                self.token_scores(boards, 3 - t, t, variant))
+
+# Stack boards into one array.
+#
+# PARAM [list of board.Board] brds: boards of the same shape
+# RETURN [array]: the (N, h, w) int8 boards
+def stack(brds):
+    """Returns the boards as one array"""
+    return np.array([brd.board for brd in brds], dtype=np.int8)
+
+# Stack the children of a board, for scoring the leaves of a search node at once.
+#
+# PARAM [board.Board] brd: the board
+# RETURN [(list of int, array)]: the free columns, and the (N, h, w) boards
+#                                after adding a token of the player to move in each
+def children(brd):
+    """Returns the free columns and the boards they lead to"""
+    cols = brd.free_cols()
+    boards = np.repeat(np.array(brd.board, dtype=np.int8)[np.newaxis], len(cols), axis=0)
+    for i, x in enumerate(cols):
+        boards[i, brd.heights[x], x] = brd.player
+    return cols, boards
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+
+import sys
+import time
+
+import numpy as np
+
+import windows
+
+########################
+# Batch Playout Engine #
+########################
+
+class PlayoutEngine(object):
+    """Plays many games of one board shape at once with NumPy"""
+
+    # Class constructor.
+    #
+    # PARAM [int] w: the board width
+    # PARAM [int] h: the board height
+    # PARAM [int] n: the number of tokens to line up to win
+    # PARAM [int] seed: the seed of the random column choices (None for a random seed)
+    #
+    # NOTE: Boards are held as one (N, h, w) int8 array, in the layout of
+    #       board.Board.board: row y of column x is boards[i, y, x], and row 0
+    #       fills first.
+    def __init__(self, w, h, n, seed=None):
+        """Class constructor"""
+        self.w = w
+        self.h = h
+        self.n = n
+        self.rng = np.random.default_rng(seed)
+        table = windows.window_table(w, h, n)
+        # Cells of every window, one row per window, numbered y*w+x
+        self.window_cells = np.array(table.cells, dtype=np.intp).reshape(table.count, n)
+        # Windows through every cell, padded to the same length; padding
+        # entries point to window 0 and are masked out by through_valid
+        longest = max(table.offsets[c + 1] - table.offsets[c] for c in range(w * h))
+        self.through = np.zeros((w * h, longest), dtype=np.intp)
+        self.through_valid = np.zeros((w * h, longest), dtype=bool)
+        for c in range(w * h):
+            ws = table.index[table.offsets[c]:table.offsets[c + 1]]
+            self.through[c, :len(ws)] = ws
+            self.through_valid[c, :len(ws)] = True
+        self.reset(0)
+
+    # Start a new batch of games.
+    #
+    # PARAM [int]               count:  the number of games
+    # PARAM [2D list of int]    board:  the starting position, row-major as in
+    #                                   board.Board.board (None for an empty board)
+    # PARAM [int]               player: the player to move in the starting position [1|2]
+    # PARAM [bool]              record: if True, keep the columns played in every game
+    def reset(self, count, board=None, player=1, record=False):
+        """Sets up count games from the same position"""
+        if board is None:
+            start = np.zeros((self.h, self.w), dtype=np.int8)
+        else:
+            start = np.array(board, dtype=np.int8).reshape(self.h, self.w)
+        # Boards, column heights and player to move of every game
+        self.boards = np.repeat(start[np.newaxis], count, axis=0)
+        self.heights = np.repeat((start != 0).sum(axis=0)[np.newaxis], count, axis=0)
+        self.player = np.full(count, player, dtype=np.int8)
+        # Winner of every finished game (0 for a tie), and whether it is over
+        self.winner = np.zeros(count, dtype=np.int8)
+        self.done = np.zeros(count, dtype=bool)
+        # Tokens added in every game
+        self.plies = np.zeros(count, dtype=np.int16)
+        self.empty = self.w * self.h - int((start != 0).sum())
+        if self.empty == 0:
+            self.done[:] = True
+        # Columns played in every game, -1 past its end
+        self.moves = None
+        if record:
+            self.moves = np.full((count, self.empty), -1, dtype=np.int8)
+
+    # Pick a column in each of the given games.
+    #
+    # PARAM [array of int] idx:    the games to play in
+    # PARAM [function]     policy: called with the engine and idx, returns an
+    #                              (len(idx), w) array of non-negative column
+    #                              weights; None for uniform random play
+    # RETURN [array of int]: the chosen column of each game
+    def choose(self, idx, policy):
+        """Draws a legal column per game, with probability proportional to its weight"""
+        legal = self.heights[idx] < self.h
+        if policy is None:
+            weights = legal.astype(np.float64)
+        else:
+            weights = np.where(legal, policy(self, idx), 0.0)
+        cum = np.cumsum(weights, axis=1)
+        r = self.rng.random(len(idx)) * cum[:, -1]
+        cols = (cum <= r[:, np.newaxis]).sum(axis=1)
+        # A policy giving no weight to any legal column falls back to the first legal one
+        stuck = cum[:, -1] <= 0
+        if stuck.any():
+            cols[stuck] = legal[stuck].argmax(axis=1)
+        return np.minimum(cols, self.w - 1)
+
+    # Play one token in every game still running.
+    #
+    # PARAM [function] policy: see choose()
+    # RETURN [int]: the number of games still running
+    def step(self, policy=None):
+        """Advances all the unfinished games by one ply"""
+        idx = np.flatnonzero(~self.done)
+        if len(idx) == 0:
+            return 0
+        cols = self.choose(idx, policy)
+        rows = self.heights[idx, cols]
+        player = self.player[idx]
+        self.boards[idx, rows, cols] = player
+        self.heights[idx, cols] += 1
+        if self.moves is not None:
+            self.moves[idx, self.plies[idx]] = cols
+        self.plies[idx] += 1
+        # Only the windows through the new tokens can have been completed
+        cells = rows * self.w + cols
+        ws = self.through[cells]
+        flat = self.boards.reshape(len(self.boards), -1)
+        tokens = flat[idx[:, np.newaxis, np.newaxis], self.window_cells[ws]]
+        full = (tokens == player[:, np.newaxis, np.newaxis]).all(axis=2)
+        won = (full & self.through_valid[cells]).any(axis=1)
+        self.winner[idx[won]] = player[won]
+        self.done[idx[won]] = True
+        self.done[idx[self.plies[idx] == self.empty]] = True
+        self.player[idx] = 3 - player
+        return len(idx) - int(self.done[idx].sum())
+
+    # Play every game to the end.
+    #
+    # PARAM [function] policy: see choose()
+    # RETURN [array of int]: the winner of every game, 0 for a tie
+    def run(self, policy=None):
+        """Plays all the games until they are over"""
+        while self.step(policy) > 0:
+            pass
+        return self.winner
+
+    # Count the results of the games.
+    #
+    # RETURN [list of int]: the number of ties, wins of Player 1 and wins of Player 2
+    def results(self):
+        """Returns how many games ended in a tie or a win of each player"""
+        return np.bincount(self.winner[self.done], minlength=3).tolist()
+
+if __name__ == "__main__":
+    #
+    # Parse arguments
+    #
+    if not len(sys.argv) in [5,6]:
+        print("Usage:\n  {} <games> <board width> <board height> <tokens to win> [seed]".format(sys.argv[0]))
+        sys.exit(1)
+
+    GAMES        = int(sys.argv[1])
+    BOARD_WIDTH  = int(sys.argv[2])
+    BOARD_HEIGHT = int(sys.argv[3])
+    TOKENS       = int(sys.argv[4])
+    SEED         = None
+    if len(sys.argv) == 6:
+        SEED = int(sys.argv[5])
+
+    #
+    # Random vs. random baseline
+    #
+    engine = PlayoutEngine(BOARD_WIDTH, BOARD_HEIGHT, TOKENS, SEED)
+    st = time.time()
+    engine.reset(GAMES)
+    engine.run()
+    elapsed = time.time() - st
+    ties, p1, p2 = engine.results()
+    print("Player 1 wins: {:.1%}".format(p1 / GAMES))
+    print("Player 2 wins: {:.1%}".format(p2 / GAMES))
+    print("Ties:          {:.1%}".format(ties / GAMES))
+    print("Average length: {:.1f} tokens".format(engine.plies.mean()))
+    print("{:.0f} games/s".format(GAMES / elapsed))
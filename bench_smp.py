@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+
+import random
+import sys
+import time
+
+import board
+import alpha_beta_agent as aba
+
+#
+# Parse arguments
+#
+if not len(sys.argv) in [3,6]:
+    print("Usage:\n  {} <workers> <depth> [<board width> <board height> <tokens to win>]".format(sys.argv[0]))
+    sys.exit(1)
+
+WORKERS      = int(sys.argv[1])
+DEPTH        = int(sys.argv[2])
+BOARD_WIDTH  = 10
+BOARD_HEIGHT = 8
+TOKENS       = 5
+if len(sys.argv) == 6:
+    BOARD_WIDTH  = int(sys.argv[3])
+    BOARD_HEIGHT = int(sys.argv[4])
+    TOKENS       = int(sys.argv[5])
+
+# Set random seed for reproducibility
+random.seed(1)
+
+#
+# Make test positions by playing random opening moves
+#
+positions = []
+while len(positions) < 5:
+    brd = board.Board([[0] * BOARD_WIDTH for i in range(BOARD_HEIGHT)], BOARD_WIDTH, BOARD_HEIGHT, TOKENS)
+    for i in range(random.randint(2, 10)):
+        brd.add_token(random.choice(brd.free_cols()))
+    if brd.get_outcome() == 0:
+        positions.append(brd)
+
+#
+# Time to depth, single process vs. Lazy SMP
+#
+def time_to_depth(workers):
+    total = 0
+    for brd in positions:
+        # A fresh agent per position, so no table is reused
+        a = aba.AlphaBetaAgent("bench", DEPTH, iterative=True, workers=workers)
+        st = time.time()
+        a.go(brd.copy())
+        total = total + time.time() - st
+        a.close()
+    return total
+
+single = time_to_depth(1)
+print("1 process:   {:.2f}s to depth {}".format(single, DEPTH))
+parallel = time_to_depth(WORKERS)
+print("{} processes: {:.2f}s to depth {}".format(WORKERS, parallel, DEPTH))
+print("Speedup: {:.2f}x".format(single / parallel))
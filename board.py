@@ -1,4 +1,33 @@
-import copy
+import random
+import windows
+
+###################
+# Zobrist hashing #
+###################
+
+# Memoized Zobrist tables, indexed by board shape (w, h, n)
+_zobrist = {}
+
+# Get the Zobrist tables for the given board shape.
+#
+# The tables are generated from a seed derived from the shape, so keys are
+# the same across runs and processes.
+#
+# PARAM [int] w: the board width
+# PARAM [int] h: the board height
+# PARAM [int] n: the number of tokens to line up to win
+# RETURN [(list of list of int, int)]: the random keys indexed by player and
+#                                      bit index of the cell, and the key
+#                                      toggled when Player 2 is to move
+def zobrist_tables(w, h, n):
+    """Returns the (memoized) Zobrist tables for a board shape"""
+    shape = (w, h, n)
+    if shape not in _zobrist:
+        rng = random.Random("zobrist {} {} {}".format(w, h, n))
+        size = w * (h + 1)
+        keys = [[0] * size] + [[rng.getrandbits(64) for i in range(size)] for p in (1, 2)]
+        _zobrist[shape] = (keys, rng.getrandbits(64))
+    return _zobrist[shape]
 
 ##############
 # Game Board #
@@ -6,12 +35,20 @@ import copy
 
 class Board(object):
 
+    # When True, every call to get_outcome() is checked against a full rescan
+    validate = False
+
     # Class constructor.
     #
     # PARAM [2D list of int] board: the board configuration, row-major
     # PARAM [int]            w:     the board width
     # PARAM [int]            h:     the board height
     # PARAM [int]            n:     the number of tokens to line up to win
+    #
+    # NOTE: Besides the row-major list, the board keeps a bitboard: one integer
+    #       mask per player plus the height of every column. Cell (x,y) is bit
+    #       x*(h+1)+y; the extra bit on top of each column is always empty and
+    #       stops lines from wrapping into the next column.
     def __init__(self, board, w, h, n):
         """Class constructor"""
         # Board data
@@ -24,16 +61,93 @@ class Board(object):
         self.n = n
         # Current player
         self.player = 1
+        # Number of free slots taken in each column
+        self.heights = [0] * w
+        # Token masks, indexed by player (index 0 is unused)
+        self.masks = [0, 0, 0]
+        # Winning windows of this board shape
+        self.windows = windows.window_table(w, h, n)
+        # Zobrist key of the tokens, and of the tokens mirrored left-right
+        self.hash = 0
+        self.mirror_hash = 0
+        keys = zobrist_tables(w, h, n)[0]
+        for x in range(w):
+            for y in range(h):
+                t = board[y][x]
+                if t != 0:
+                    self.masks[t] |= 1 << (x * (h + 1) + y)
+                    self.heights[x] = y + 1
+                    self.hash ^= keys[t][x * (h + 1) + y]
+                    self.mirror_hash ^= keys[t][(w - 1 - x) * (h + 1) + y]
+        # Cell (x,y) of the last token added, None if unknown
+        self.last_move = None
+        # Cached game outcome, None if it must be computed with a full scan
+        self.outcome = None
+        # True if the last move has not been checked for a line yet
+        self.pending = False
+        # Stack of the state needed to undo each move played on this board
+        self.moves = []
 
     # Clone a board.
     #
     # RETURN [board.Board]: a deep copy of this object
     def copy(self):
         """Returns a copy of this board that can be independently modified"""
-        cpy = Board(copy.deepcopy(self.board), self.w, self.h, self.n)
+        cpy = Board.__new__(Board)
+        cpy.board = [row[:] for row in self.board]
+        cpy.w = self.w
+        cpy.h = self.h
+        cpy.n = self.n
         cpy.player = self.player
+        cpy.heights = self.heights[:]
+        cpy.masks = self.masks[:]
+        cpy.windows = self.windows
+        cpy.hash = self.hash
+        cpy.mirror_hash = self.mirror_hash
+        cpy.last_move = self.last_move
+        cpy.outcome = self.outcome
+        cpy.pending = self.pending
+        cpy.moves = self.moves[:]
         return cpy
 
+    # Get the Zobrist key of the position.
+    #
+    # RETURN [int]: a 64-bit key identifying the tokens and the player to move
+    def key(self):
+        """Returns the 64-bit Zobrist key of this position"""
+        if self.player == 2:
+            return self.hash ^ zobrist_tables(self.w, self.h, self.n)[1]
+        return self.hash
+
+    # Get the Zobrist key of the position mirrored left-right.
+    #
+    # RETURN [int]: the key() of the mirror image of this position
+    def mirror_key(self):
+        """Returns the 64-bit Zobrist key of the left-right mirror of this position"""
+        if self.player == 2:
+            return self.mirror_hash ^ zobrist_tables(self.w, self.h, self.n)[1]
+        return self.mirror_hash
+
+    # Check if a mask contains n tokens in a row in any direction.
+    #
+    # PARAM [int] mask: the token mask of a player
+    # RETURN [Bool]: True if n tokens in a row have been found, False otherwise
+    def is_line_in(self, mask):
+        """Return True if the given token mask contains n tokens in a row"""
+        # Vertical, horizontal, diagonal up, diagonal down
+        for s in (1, self.h + 1, self.h + 2, self.h):
+            # Keep only the cells that start a run of k tokens, doubling k
+            m = mask
+            k = 1
+            while 2 * k <= self.n:
+                m &= m >> (k * s)
+                k *= 2
+            if k < self.n:
+                m &= m >> ((self.n - k) * s)
+            if m:
+                return True
+        return False
+
     # Check if a line of identical tokens exists starting at (x,y) in direction (dx,dy)
     #
     # PARAM [int] x:  the x coordinate of the starting cell
@@ -67,16 +181,72 @@ class Board(object):
                 self.is_line_at(x, y, 1, 1) or # Diagonal up
                 self.is_line_at(x, y, 1, -1)) # Diagonal down
 
+    # Check if the token at (x,y) is part of a line of n identical tokens
+    #
+    # PARAM [int] x:  the x coordinate of the cell
+    # PARAM [int] y:  the y coordinate of the cell
+    # RETURN [Bool]: True if n tokens of the same type have been found, False otherwise
+    def is_line_through(self, x, y):
+        """Return True if the token at (x,y) belongs to a line of n identical tokens"""
+        mask = self.masks[self.board[y][x]]
+        wmasks = self.windows.masks
+        # Is any window through (x,y) full of the same tokens?
+        for wi in self.windows.windows_at(x, y):
+            m = wmasks[wi]
+            if mask & m == m:
+                return True
+        return False
+
+    # Get the columns where a player would complete a line.
+    #
+    # PARAM [int] player: the player [1|2]
+    # RETURN [list of int]: the columns where a token of the player wins at once
+    def winning_cols(self, player):
+        """Returns the columns where adding a token of the given player makes a line"""
+        mask = self.masks[player]
+        wmasks = self.windows.masks
+        cols = []
+        for x in range(self.w):
+            y = self.heights[x]
+            if y >= self.h:
+                continue
+            m = mask | (1 << (x * (self.h + 1) + y))
+            for wi in self.windows.windows_at(x, y):
+                if m & wmasks[wi] == wmasks[wi]:
+                    cols.append(x)
+                    break
+        return cols
+
+    # Calculate the game outcome by scanning the whole board.
+    #
+    # RETURN [int]: 1 for Player 1, 2 for Player 2, and 0 for no winner
+    def scan_outcome(self):
+        """Returns the winner of the game, ignoring the cached outcome"""
+        if self.is_line_in(self.masks[1]):
+            return 1
+        if self.is_line_in(self.masks[2]):
+            return 2
+        return 0
+
     # Calculate the game outcome.
     #
+    # Only the lines through the last token are checked, and the result is
+    # cached until the next call to add_token(). A full scan is done only when
+    # the history of the board is unknown.
+    #
     # RETURN [int]: 1 for Player 1, 2 for Player 2, and 0 for no winner
     def get_outcome(self):
         """Returns the winner of the game: 1 for Player 1, 2 for Player 2, and 0 for no winner"""
-        for x in range(self.w):
-            for y in range(self.h):
-                if (self.board[y][x] != 0) and self.is_any_line_at(x,y):
-                    return self.board[y][x]
-        return 0
+        if self.pending:
+            self.pending = False
+            x, y = self.last_move
+            if self.is_line_through(x, y):
+                self.outcome = self.board[y][x]
+        elif self.outcome is None:
+            self.outcome = self.scan_outcome()
+        if Board.validate:
+            assert self.outcome == self.scan_outcome(), "incremental outcome mismatch"
+        return self.outcome
 
     # Adds a token for the current player at the given column
     #
@@ -85,23 +255,64 @@ class Board(object):
     # NOTE: This method switches the current player.
     def add_token(self, x):
         """Adds a token for the current player at column x; the column is assumed not full"""
+        self.play(x)
+
+    # Plays a token for the current player at the given column, so that it
+    # can later be taken back with undo().
+    #
+    # PARAM [int] x: The column where the token must be added; the column is assumed not full.
+    # RETURN [int]: the row where the token landed
+    #
+    # NOTE: This method switches the current player.
+    def play(self, x):
+        """Adds a token for the current player at column x and pushes the move on the move stack"""
+        # Settle the outcome of the previous move before it is forgotten
+        if self.pending:
+            self.get_outcome()
+        self.moves.append((x, self.last_move, self.outcome))
         # Find empty slot for token
-        y = 0
-        while self.board[y][x] != 0:
-            y = y + 1
+        y = self.heights[x]
+        self.heights[x] = y + 1
         self.board[y][x] = self.player
+        self.masks[self.player] |= 1 << (x * (self.h + 1) + y)
+        keys = zobrist_tables(self.w, self.h, self.n)[0][self.player]
+        self.hash ^= keys[x * (self.h + 1) + y]
+        self.mirror_hash ^= keys[(self.w - 1 - x) * (self.h + 1) + y]
+        # Lines through the new token are checked on demand
+        self.last_move = (x, y)
+        self.pending = self.outcome == 0
         # Switch player
         if self.player == 1:
             self.player = 2
         else:
             self.player = 1
+        return y
+
+    # Takes back the last move played on this board.
+    #
+    # NOTE: This method switches the current player back.
+    def undo(self):
+        """Removes the token added by the last call to play() or add_token()"""
+        x, self.last_move, self.outcome = self.moves.pop()
+        self.pending = False
+        # Free the slot
+        y = self.heights[x] - 1
+        t = self.board[y][x]
+        self.heights[x] = y
+        self.board[y][x] = 0
+        self.masks[t] &= ~(1 << (x * (self.h + 1) + y))
+        keys = zobrist_tables(self.w, self.h, self.n)[0][t]
+        self.hash ^= keys[x * (self.h + 1) + y]
+        self.mirror_hash ^= keys[(self.w - 1 - x) * (self.h + 1) + y]
+        # The player who added the token is to move again
+        self.player = t
 
     # Returns a list of the columns with at least one free slot.
     #
     # RETURN [list of int]: the columns with at least one free slot
     def free_cols(self):
         """Returns a list of the columns with at least one free slot"""
-        return [x for x in range(self.w) if self.board[-1][x] == 0 ]
+        return [x for x in range(self.w) if self.heights[x] < self.h]
 
     # Prints the current board state.
     def print_it(self):
@@ -119,3 +330,74 @@ class Board(object):
         for i in range(self.w):
             print(i, end='')
         print("")
+
+###################
+# Read-only Board #
+###################
+
+class BoardView(object):
+    """Read-only view of a board, handed to the agents instead of a copy"""
+
+    # Attributes and methods of the board that can be used through the view
+    READABLE = frozenset(("w", "h", "n", "player", "windows", "hash", "mirror_hash",
+                          "last_move", "key", "mirror_key", "free_cols", "get_outcome",
+                          "scan_outcome", "is_line_in", "is_line_at", "is_any_line_at",
+                          "is_line_through", "winning_cols", "print_it"))
+
+    __slots__ = ("_brd", "_grid", "_grid_key")
+
+    # Class constructor.
+    #
+    # PARAM [board.Board] brd: the board to show; the view follows its changes
+    #
+    # NOTE: get_outcome() may fill in the cached outcome of the board, which
+    #       does not change the game state.
+    def __init__(self, brd):
+        """Class constructor"""
+        object.__setattr__(self, "_brd", brd)
+        # Snapshot of the rows, and the position it was taken in
+        object.__setattr__(self, "_grid", None)
+        object.__setattr__(self, "_grid_key", None)
+
+    def __getattr__(self, name):
+        if name in BoardView.READABLE:
+            return getattr(self._brd, name)
+        raise AttributeError("'BoardView' object has no attribute '{}'".format(name))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Board views are read-only; use copy() to get a board to modify")
+
+    # Number of free slots taken in each column
+    @property
+    def heights(self):
+        return tuple(self._brd.heights)
+
+    # Token masks, indexed by player (index 0 is unused)
+    @property
+    def masks(self):
+        return tuple(self._brd.masks)
+
+    # Board data, row-major. The rows are copied once per position, the first
+    # time they are asked for, so changing them does not change the game.
+    @property
+    def board(self):
+        key = (self._brd.hash, self._brd.player)
+        if self._grid_key != key:
+            object.__setattr__(self, "_grid", [row[:] for row in self._brd.board])
+            object.__setattr__(self, "_grid_key", key)
+        return self._grid
+
+    # Clone the board.
+    #
+    # RETURN [board.Board]: a copy of the board that can be modified
+    def copy(self):
+        """Returns a copy of the board that can be independently modified"""
+        return self._brd.copy()
+
+    # copy.copy() and copy.deepcopy() of a view give a board to modify, as
+    # they did when the agents were handed a Board
+    def __copy__(self):
+        return self._brd.copy()
+
+    def __deepcopy__(self, memo):
+        return self._brd.copy()
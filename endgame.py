@@ -0,0 +1,174 @@
+import time
+import board
+import transposition
+
+# Raised inside the solver when its deadline has passed
+class SolverTimeout(Exception):
+    """The solver ran out of time"""
+    pass
+
+##################
+# Endgame Solver #
+##################
+
+# Results of a solved position, for the player to move
+WIN = 1
+DRAW = 0
+LOSS = -1
+
+class EndgameSolver(object):
+    """Exact win/loss/draw solver working directly on bitboards"""
+
+    # Class constructor.
+    #
+    # PARAM [int] tt_size: the transposition table budget in bytes
+    def __init__(self, tt_size=1 << 22):
+        """Class constructor"""
+        # Solved values do not depend on where the search started, so the
+        # table stays valid as long as the board shape does not change
+        self.tt = transposition.TranspositionTable(tt_size)
+        self.shape = None
+        # Nodes visited by the last call to solve()
+        self.nodes = 0
+        # Time (time.monotonic()) after which solving is aborted, None for no limit
+        self.deadline = None
+
+    # Solve a position.
+    #
+    # PARAM [board.Board] brd:      the position, with no winner yet and at
+    #                               least one free column
+    # PARAM [float]       deadline: the time.monotonic() time after which
+    #                               SolverTimeout is raised, None for no limit
+    # RETURN [(int, int)]: WIN, DRAW or LOSS for the player to move, and a move
+    #                      that achieves it
+    def solve(self, brd, deadline=None):
+        """Returns the game-theoretic result of a position and the best move"""
+        shape = (brd.w, brd.h, brd.n)
+        if shape != self.shape:
+            self.tt.clear()
+            self.shape = shape
+        self.w = brd.w
+        self.h = brd.h
+        self.windows = brd.windows
+        self.keys = board.zobrist_tables(brd.w, brd.h, brd.n)[0]
+        self.heights = list(brd.heights)
+        self.nodes = 0
+        self.deadline = deadline
+        # Columns, middle first
+        self.order = sorted(range(brd.w), key=lambda x: abs(2 * x - (brd.w - 1)))
+        player = brd.player
+        other = 3 - player
+        cur = brd.masks[player]
+        opp = brd.masks[other]
+        empty = brd.w * brd.h - sum(self.heights)
+        # Root: same as negamax(), but keeping track of the move
+        for x in self.order:
+            y = self.heights[x]
+            if y < self.h and self.wins(cur | (1 << (x * (self.h + 1) + y)), x, y):
+                return WIN, x
+        best = None
+        best_move = None
+        a = LOSS
+        for x in self.order:
+            y = self.heights[x]
+            if y >= self.h:
+                continue
+            bit = 1 << (x * (self.h + 1) + y)
+            self.heights[x] = y + 1
+            v = -self.negamax(opp, cur | bit, brd.hash ^ self.keys[player][x * (self.h + 1) + y],
+                              other, empty - 1, -WIN, -a)
+            self.heights[x] = y
+            if best is None or v > best:
+                best = v
+                best_move = x
+                a = max(a, v)
+                if v == WIN:
+                    break
+        return best, best_move
+
+    # Check if a token completes a line.
+    #
+    # PARAM [int] mask: the tokens of the player, including the new one
+    # PARAM [int] x: the column of the new token
+    # PARAM [int] y: the row of the new token
+    # RETURN [Bool]: True if a window through (x,y) is full of the player's tokens
+    def wins(self, mask, x, y):
+        """Returns True if the token at (x,y) completes a line"""
+        wmasks = self.windows.masks
+        for wi in self.windows.windows_at(x, y):
+            m = wmasks[wi]
+            if mask & m == m:
+                return True
+        return False
+
+    # Solve a position with alpha-beta on win/draw/loss values.
+    #
+    # PARAM [int] cur: the tokens of the player to move
+    # PARAM [int] opp: the tokens of the opponent
+    # PARAM [int] key: the Zobrist key of the tokens
+    # PARAM [int] player: the player to move [1|2]
+    # PARAM [int] empty: the number of empty cells
+    # PARAM [int] a: the alpha value
+    # PARAM [int] b: the beta value
+    # RETURN [int]: WIN, DRAW or LOSS for the player to move (a bound if
+    #               outside the (a, b) window)
+    def negamax(self, cur, opp, key, player, empty, a, b):
+        """Returns the result of the position for the player to move"""
+        self.nodes += 1
+        if self.deadline is not None and self.nodes & 1023 == 0:
+            if time.monotonic() > self.deadline:
+                raise SolverTimeout()
+        h = self.h
+        heights = self.heights
+        # Immediate win
+        for x in self.order:
+            y = heights[x]
+            if y < h and self.wins(cur | (1 << (x * (h + 1) + y)), x, y):
+                return WIN
+        # The last free cell cannot win, so the board fills up
+        if empty <= 1:
+            return DRAW
+        # Transposition table
+        first = None
+        entry = self.tt.probe(key)
+        if entry is not None:
+            value, depth, bound, first, gen = entry
+            value = int(value)
+            if bound == transposition.EXACT:
+                return value
+            if bound == transposition.LOWER:
+                a = max(a, value)
+            else:
+                b = min(b, value)
+            if a >= b:
+                return value
+        a0 = a
+        moves = self.order
+        if first is not None:
+            moves = [first] + [x for x in self.order if x != first]
+        keys = self.keys[player]
+        best = None
+        best_move = None
+        for x in moves:
+            y = heights[x]
+            if y >= h:
+                continue
+            bit = 1 << (x * (h + 1) + y)
+            heights[x] = y + 1
+            v = -self.negamax(opp, cur | bit, key ^ keys[x * (h + 1) + y], 3 - player, empty - 1, -b, -a)
+            heights[x] = y
+            if best is None or v > best:
+                best = v
+                best_move = x
+            if best > a:
+                a = best
+            if a >= b:
+                break
+        if best <= a0:
+            bound = transposition.UPPER
+        elif best >= b:
+            bound = transposition.LOWER
+        else:
+            bound = transposition.EXACT
+        self.tt.store(key, best, 0, bound, best_move)
+        return best
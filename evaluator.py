@@ -0,0 +1,157 @@
+from array import array
+
+###################################
+# Incremental heuristic evaluator #
+###################################
+
+class IncrementalEvaluator(object):
+    """Keeps the alpha-beta heuristic up to date as tokens are played and taken back"""
+
+    # Class constructor.
+    #
+    # PARAM [board.Board] brd: the board to evaluate; the evaluator must then be
+    #                          told about every token played or taken back
+    #
+    # NOTE: The score is the one of AlphaBetaAgent.count_windows(): a window
+    #       holding k tokens of a single player scores k+n-2 for that player
+    #       for each of its two ends holding one of those tokens.
+    def __init__(self, brd):
+        """Class constructor"""
+        self.w = brd.w
+        self.n = brd.n
+        self.windows = brd.windows
+        # Tokens of the board, row-major
+        self.cells = bytearray(t for row in brd.board for t in row)
+        # Tokens of each player in each window (index 0 is unused)
+        count = self.windows.count
+        self.counts = [None, array('B', bytes(count)), array('B', bytes(count))]
+        # Score of each window for each player (index 0 is unused)
+        self.contribs = [None, array('i', bytes(4 * count)), array('i', bytes(4 * count))]
+        # Running score of each player (index 0 is unused)
+        self.scores = [0, 0, 0]
+        # Number of windows one token away from a line for each player, that
+        # is, holding n-1 of the player's tokens and none of the opponent's
+        # (index 0 is unused)
+        self.threats = [0, 0, 0]
+        # Number of windows each player can still complete, that is, holding
+        # none of the opponent's tokens (index 0 is unused)
+        self.open_windows = [0, 0, 0]
+        wcells = self.windows.cells
+        for wi in range(count):
+            for c in wcells[wi * self.n:(wi + 1) * self.n]:
+                t = self.cells[c]
+                if t != 0:
+                    self.counts[t][wi] += 1
+        for wi in range(count):
+            self.update_window(wi)
+            for p in (1, 2):
+                if self.counts[3 - p][wi] == 0:
+                    self.open_windows[p] += 1
+                    if self.counts[p][wi] == self.n - 1:
+                        self.threats[p] += 1
+
+    # Recompute the score of a window after one of its cells changed.
+    #
+    # PARAM [int] wi: the index of the window
+    def update_window(self, wi):
+        """Refreshes the contribution of window wi to the running scores"""
+        n = self.n
+        c1 = self.counts[1][wi]
+        c2 = self.counts[2][wi]
+        v1 = 0
+        v2 = 0
+        if c1 and not c2:
+            start = wi * n
+            ends = ((self.cells[self.windows.cells[start]] == 1) +
+                    (self.cells[self.windows.cells[start + n - 1]] == 1))
+            v1 = ends * (c1 + n - 2)
+        elif c2 and not c1:
+            start = wi * n
+            ends = ((self.cells[self.windows.cells[start]] == 2) +
+                    (self.cells[self.windows.cells[start + n - 1]] == 2))
+            v2 = ends * (c2 + n - 2)
+        self.scores[1] += v1 - self.contribs[1][wi]
+        self.contribs[1][wi] = v1
+        self.scores[2] += v2 - self.contribs[2][wi]
+        self.contribs[2][wi] = v2
+
+    # Account for a token added to the board.
+    #
+    # PARAM [int] x: the column of the token
+    # PARAM [int] y: the row of the token
+    # PARAM [int] t: the player of the token [1|2]
+    def play(self, x, y, t):
+        """Adds token t at (x,y) and updates the windows through it"""
+        self.cells[y * self.w + x] = t
+        n = self.n
+        counts = self.counts[t]
+        others = self.counts[3 - t]
+        for wi in self.windows.windows_at(x, y):
+            counts[wi] += 1
+            self.update_window(wi)
+            c = counts[wi]
+            co = others[wi]
+            if co == 0:
+                if c == n - 1:
+                    self.threats[t] += 1
+                elif c == n:
+                    self.threats[t] -= 1
+            if c == 1:
+                # The opponent can no longer complete this window
+                self.open_windows[3 - t] -= 1
+                if co == n - 1:
+                    self.threats[3 - t] -= 1
+
+    # Account for a token removed from the board.
+    #
+    # PARAM [int] x: the column of the token
+    # PARAM [int] y: the row of the token
+    def undo(self, x, y):
+        """Removes the token at (x,y) and updates the windows through it"""
+        c = y * self.w + x
+        t = self.cells[c]
+        self.cells[c] = 0
+        n = self.n
+        counts = self.counts[t]
+        others = self.counts[3 - t]
+        for wi in self.windows.windows_at(x, y):
+            # Same transitions as in play(), backwards
+            c = counts[wi]
+            co = others[wi]
+            if co == 0:
+                if c == n - 1:
+                    self.threats[t] -= 1
+                elif c == n:
+                    self.threats[t] += 1
+            if c == 1:
+                self.open_windows[3 - t] += 1
+                if co == n - 1:
+                    self.threats[3 - t] += 1
+            counts[wi] -= 1
+            self.update_window(wi)
+
+    # Check whether a player may be able to win with the next token.
+    #
+    # PARAM [int] player: the player [1|2]
+    # RETURN [Bool]: False if no window holds n-1 tokens of the player and
+    #                none of the opponent, so the player cannot win at once
+    def may_win(self, player):
+        """Returns True if some window is one token away from a line for the player"""
+        return self.threats[player] > 0
+
+    # Check whether the game can only end in a draw.
+    #
+    # RETURN [Bool]: True if every window holds tokens of both players
+    #
+    # NOTE: Such a board also scores 0, as does every board after it.
+    def is_dead(self):
+        """Returns True if neither player can complete a line anymore"""
+        return self.open_windows[1] == 0 and self.open_windows[2] == 0
+
+    # Get the heuristic score of the board.
+    #
+    # PARAM [int] player: the player to score the board for [1|2]
+    # RETURN [int]: the score of the player minus the score of the opponent
+    def score(self, player):
+        """Returns the board score from the point of view of the given player"""
+        return self.scores[player] - self.scores[3 - player]
@@ -1,6 +1,8 @@
 import board
 import agent
+import remote_agent
 import time
+import traceback
 from pathlib import Path
 
 ########
@@ -19,12 +21,67 @@ class Game(object):
     # PARAM [agent.Agent] p2: the agent for Player 2
     def __init__(self, w, h, n, p1, p2):
         """Class constructor"""
-        # Create board
+        # Create board, and the read-only view of it the players get
         self.board = board.Board([[0] * w for i in range(h)], w, h, n)
+        self.view = board.BoardView(self.board)
         # Players
         self.players = [ p1, p2 ]
         p1.player = 1
         p2.player = 2
+        # Time spent thinking and moves made by each player in timed games
+        self.think_time = [ 0.0, 0.0 ]
+        self.moves_made = [ 0, 0 ]
+        # Column and thinking time of every move of a timed game; if the game
+        # was forfeited, the last move is the one that lost it
+        self.moves = []
+        self.forfeit = False
+        # Game outcome, once over
+        self.outcome = None
+
+    # Tell both players about a legal move.
+    #
+    # PARAM [int] x: the column where the token was added
+    # PARAM [int] p: the player who added the token [1|2]
+    def tell_move(self, x, p):
+        for player in self.players:
+            player.move_played(x, p)
+
+    # Ask a player for a move in a timed game.
+    #
+    # PARAM  [int] p: the index of the player to move [0|1]
+    # RETURN [int]: the column chosen, or None if the agent failed
+    def ask_move(self, p):
+        try:
+            # Make move on a read-only view so player can't modify the board
+            return self.players[p].go(self.view)
+        except Exception:
+            # A failing agent loses the game, as with an illegal move
+            traceback.print_exc()
+            return None
+
+    # Check whether a move took too long.
+    #
+    # PARAM  [int]   p:     the index of the player who moved [0|1]
+    # PARAM  [float] et:    the wall time the move took in seconds
+    # PARAM  [float] limit: the time limit in seconds
+    # RETURN [Bool]: True if the move is forfeited
+    def over_time(self, p, et, limit):
+        player = self.players[p]
+        # Only the wrappers of run_match.get_agent() are trusted to time their
+        # agent; any other agent, RemoteAgent or not, gets the wall time limit
+        if remote_agent.trusted(player):
+            return player.overran
+        return et > limit
+
+    # Tell both players the game is over.
+    #
+    # PARAM  [int] outcome: the game outcome
+    # RETURN [int]: the game outcome
+    def end_game(self, outcome):
+        self.outcome = outcome
+        for player in self.players:
+            player.game_over(outcome)
+        return outcome
 
     # Execute the game.
     #
@@ -35,8 +92,8 @@ class Game(object):
         p = 0
         while self.board.free_cols() and self.board.get_outcome() == 0:
             self.board.print_it()
-            # Copy board so player can't modify it
-            x = self.players[p].go(self.board.copy())
+            # Show the board read-only so player can't modify it
+            x = self.players[p].go(self.view)
             print(self.players[p].name, "move:", x)
             if not x in self.board.free_cols():
                 print("Illegal move")
@@ -44,9 +101,10 @@ class Game(object):
                 if p == 0:
                     outcome = 2
                 print(self.players[outcome-1].name, "won!")
-                return outcome
+                return self.end_game(outcome)
             # Legal move, add token there
             self.board.add_token(x)
+            self.tell_move(x, p + 1)
             # Switch player
             if p == 0:
                 p = 1
@@ -60,7 +118,7 @@ class Game(object):
             print("It's a tie!")
         else:
             print(self.players[outcome-1].name, "won!")
-        return outcome
+        return self.end_game(outcome)
 
     # Execute a timed game.
     #
@@ -71,30 +129,37 @@ class Game(object):
     # RETURN [int]: The game outcome.
     #               1 for Player 1, 2 for Player 2, and 0 for no winner
     def timed_go(self, limit):
+        # Tell the players how much time they have
+        for player in self.players:
+            player.time_limit = limit
         # Current player
         p = 0
         while self.board.free_cols() and self.board.get_outcome() == 0:
             # Get start time
             st = time.time()
-            # Make move and copy board so player can't modify it
-            x = self.players[p].go(self.board.copy())
+            x = self.ask_move(p)
             # Get elapsed time
             et = time.time() - st
+            self.think_time[p] += et
+            self.moves_made[p] += 1
+            self.moves.append((x, et))
             # Is the move legal and within the time limit?
-            if (not x in self.board.free_cols()) or (et > limit):
+            if (not x in self.board.free_cols()) or self.over_time(p, et, limit):
+                self.forfeit = True
                 outcome = 1
                 if p == 0:
                     outcome = 2
-                return outcome
+                return self.end_game(outcome)
             # Legal move, add token there
             self.board.add_token(x)
+            self.tell_move(x, p + 1)
             # Switch player
             if p == 0:
                 p = 1
             else:
                 p = 0
         # Return game outcome
-        return self.board.get_outcome()
+        return self.end_game(self.board.get_outcome())
 
     # Execute a timed game.
     #
@@ -109,24 +174,31 @@ class Game(object):
         with Path(log_file).open("w") as log:
             log.write("{} player1\n".format(self.players[0].name))
             log.write("{} player2\n".format(self.players[1].name))
+            # Tell the players how much time they have
+            for player in self.players:
+                player.time_limit = limit
             # Current player
             p = 0
             while self.board.free_cols() and self.board.get_outcome() == 0:
                 # Get start time
                 st = time.time()
-                # Make move and copy board so player can't modify it
-                x = self.players[p].go(self.board.copy())
+                x = self.ask_move(p)
                 # Get elapsed time
                 et = time.time() - st
+                self.think_time[p] += et
+                self.moves_made[p] += 1
+                self.moves.append((x, et))
                 # Is the move legal and within the time limit?
-                if (not x in self.board.free_cols()) or (et > limit):
+                if (not x in self.board.free_cols()) or self.over_time(p, et, limit):
                     # Illegal/out of time, nothing to log, end of game
+                    self.forfeit = True
                     outcome = 1
                     if p == 0:
                         outcome = 2
-                    return outcome
+                    return self.end_game(outcome)
                 # Legal move, add token there
                 self.board.add_token(x)
+                self.tell_move(x, p + 1)
                 # Log move
                 log.write("{} {}\n".format(self.players[p].name, x))
                 # Switch player
@@ -140,4 +212,4 @@ class Game(object):
             else:
                 log.write("{} wins\n".format(self.players[self.board.get_outcome()-1].name))
         # Return game outcome
-        return self.board.get_outcome()
+        return self.end_game(self.board.get_outcome())
@@ -0,0 +1,359 @@
+import atexit
+import math
+import multiprocessing
+import random
+import time
+import agent
+import windows
+try:
+    import batch_playout
+except ImportError:
+    # NumPy is optional; only batch rollouts need it
+    batch_playout = None
+
+###########
+# Rollout #
+###########
+
+# Play random moves until the game ends.
+#
+# PARAM [windows.WindowTable] table:   the windows of the board shape
+# PARAM [list of int]         masks:   the token masks, indexed by player
+#                                      (index 0 is unused); modified
+# PARAM [list of int]         heights: the number of tokens in each column; modified
+# PARAM [int]                 player:  the player to move [1|2]
+# PARAM [int]                 empty:   the number of empty cells
+# PARAM [random.Random]       rng:     the random number generator
+# RETURN [int]: the winner, 0 for a tie
+def rollout(table, masks, heights, player, empty, rng):
+    """Plays a random game from the given position and returns the winner"""
+    h = table.h
+    wmasks = table.masks
+    cols = [x for x in range(table.w) if heights[x] < h]
+    while empty > 0:
+        i = rng.randrange(len(cols))
+        x = cols[i]
+        y = heights[x]
+        heights[x] = y + 1
+        m = masks[player] | (1 << (x * (h + 1) + y))
+        masks[player] = m
+        # Only the windows through the new token can have been completed
+        for wi in table.windows_at(x, y):
+            if m & wmasks[wi] == wmasks[wi]:
+                return player
+        if y + 1 == h:
+            cols[i] = cols[-1]
+            cols.pop()
+        empty -= 1
+        player = 3 - player
+    return 0
+
+# Play a batch of rollouts from one position, in a rollout pool process.
+#
+# PARAM [tuple] task: the board shape (w, h, n), the token masks, the column
+#                     heights, the player to move, the number of empty cells,
+#                     the number of rollouts and a random seed
+# RETURN [list of int]: the number of ties, wins of Player 1 and wins of Player 2
+def rollout_batch(task):
+    shape, masks, heights, player, empty, count, seed = task
+    table = windows.window_table(*shape)
+    rng = random.Random(seed)
+    results = [0, 0, 0]
+    for i in range(count):
+        results[rollout(table, masks[:], heights[:], player, empty, rng)] += 1
+    return results
+
+##############
+# Tree Nodes #
+##############
+
+class Node(object):
+    """A position in the search tree"""
+
+    __slots__ = ("move", "player", "parent", "children", "untried", "visits", "score", "winner")
+
+    # Class constructor.
+    #
+    # PARAM [int]         move:    the column played to reach this position
+    # PARAM [int]         player:  the player who played it [1|2]
+    # PARAM [Node]        parent:  the previous position, None for the root
+    # PARAM [list of int] untried: the moves not expanded yet
+    # PARAM [int]         winner:  the winner if the game is over here (0 for
+    #                              a tie), None otherwise
+    def __init__(self, move, player, parent, untried, winner):
+        """Class constructor"""
+        self.move = move
+        self.player = player
+        self.parent = parent
+        self.children = []
+        self.untried = untried
+        # Number of rollouts through this node, and their total score for
+        # the player who moved into it (1 for a win, 0.5 for a tie)
+        self.visits = 0
+        self.score = 0.0
+        self.winner = winner
+
+#################################
+# Monte Carlo Tree Search Agent #
+#################################
+
+class MCTSAgent(agent.Agent):
+    """Agent that uses Monte Carlo tree search with UCT"""
+
+    # Class constructor.
+    #
+    # PARAM [string] name:          the name of this player
+    # PARAM [float]  time_limit:    the time limit for a move in seconds, if
+    #                               not given by the Game (1 second if neither)
+    # PARAM [float]  time_fraction: the fraction of the time limit to use
+    # PARAM [int]    playouts:      the maximum number of rollouts per move
+    #                               (None for no limit)
+    # PARAM [float]  exploration:   the UCT exploration constant
+    # PARAM [bool]   reuse:         if True, keep the subtree of the position
+    #                               reached between moves
+    # PARAM [int]    workers:       the number of processes playing the
+    #                               rollouts of each new leaf (1 to play them
+    #                               in this process)
+    # PARAM [int]    leaf_rollouts: the rollouts per worker for each new leaf
+    # PARAM [int]    batch_rollouts: the rollouts of each new leaf played at
+    #                               once by the NumPy playout engine (0 to
+    #                               play a single rollout in Python)
+    # PARAM [bool]   verbose:       if True, print search statistics after each move
+    def __init__(self, name, time_limit=None, time_fraction=0.5, playouts=None,
+                 exploration=1.4, reuse=True, workers=1, leaf_rollouts=8,
+                 batch_rollouts=0, verbose=False):
+        super().__init__(name)
+        self.time_limit = time_limit
+        self.time_fraction = time_fraction
+        self.playouts = playouts
+        self.exploration = exploration
+        self.reuse = reuse
+        self.workers = workers
+        self.leaf_rollouts = leaf_rollouts
+        if batch_rollouts > 0 and batch_playout is None:
+            raise ValueError("Batch rollouts need NumPy")
+        self.batch_rollouts = batch_rollouts
+        # NumPy playout engines, indexed by board shape (w, h, n)
+        self.engines = {}
+        self.verbose = verbose
+        # Search tree, and a board holding its root position
+        self.root = None
+        self.root_board = None
+        # Rollout pool, started on the first move
+        self.pool = None
+        # Rollouts and time of the last move, and of the whole game so far
+        self.move_playouts = 0
+        self.move_time = 0.0
+        self.total_playouts = 0
+        self.total_time = 0.0
+
+    # Pick a column.
+    #
+    # PARAM [board.Board] brd: the current board state
+    # RETURN [int]: the column where the token must be added
+    def go(self, brd):
+        """Search for the best move (choice of column for the token)"""
+        start = time.monotonic()
+        limit = self.time_limit
+        if limit is None:
+            limit = 1.0
+        deadline = start + limit * self.time_fraction
+        if self.workers > 1 and self.pool is None:
+            self.pool = multiprocessing.Pool(self.workers)
+            atexit.register(self.close)
+        root = self.find_root(brd)
+        table = brd.windows
+        empty = brd.w * brd.h - sum(brd.heights)
+        masks = list(brd.masks)
+        heights = list(brd.heights)
+        self.move_playouts = 0
+        while True:
+            self.iterate(root, table, masks, heights, empty)
+            if self.playouts is not None and self.move_playouts >= self.playouts:
+                break
+            if time.monotonic() > deadline:
+                break
+        # The most visited move is the most trusted one
+        best = root.children[0]
+        for child in root.children:
+            if child.visits > best.visits:
+                best = child
+        self.move_time = time.monotonic() - start
+        self.total_playouts += self.move_playouts
+        self.total_time += self.move_time
+        if self.verbose:
+            print("{}: {} playouts, {:.0f} playouts/s, {:.0%} expected score".format(
+                self.name, self.move_playouts, self.playouts_per_second(),
+                best.score / best.visits))
+        if self.reuse:
+            best.parent = None
+            self.root = best
+            self.root_board.play(best.move)
+        else:
+            self.root = None
+        return best.move
+
+    # Get the rollout speed of the last move.
+    #
+    # RETURN [float]: the number of rollouts per second
+    def playouts_per_second(self):
+        """Returns the rollouts per second of the last move"""
+        if self.move_time == 0:
+            return 0.0
+        return self.move_playouts / self.move_time
+
+    # Be told about a move played in the game. The tree below the opponent's
+    # move is kept for the next search.
+    #
+    # PARAM [int] x: the column where the token was added
+    # PARAM [int] player: the player who added the token [1|2]
+    def move_played(self, x, player):
+        if self.root is None or player == self.player:
+            return
+        for child in self.root.children:
+            if child.move == x:
+                child.parent = None
+                self.root = child
+                self.root_board.play(x)
+                return
+        self.root = None
+
+    # Be told that the game is over.
+    #
+    # PARAM [int] outcome: 1 for Player 1, 2 for Player 2, and 0 for no winner
+    def game_over(self, outcome):
+        if self.verbose and self.total_time > 0:
+            print("{}: {} playouts, {:.0f} playouts/s over the game".format(
+                self.name, self.total_playouts, self.total_playouts / self.total_time))
+        self.root = None
+        self.root_board = None
+        self.total_playouts = 0
+        self.total_time = 0.0
+
+    # Stop the rollout pool.
+    def close(self):
+        """Stops the rollout processes"""
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool = None
+
+    # Get the tree of the current position, reusing the last one if it got
+    # there.
+    #
+    # PARAM [board.Board] brd: the current board state
+    # RETURN [Node]: the root of the search tree
+    def find_root(self, brd):
+        """Returns the reused tree for the position, or a new one"""
+        if (self.root is not None and self.root_board.w == brd.w and
+            self.root_board.h == brd.h and self.root_board.n == brd.n and
+            self.root_board.masks == list(brd.masks)):
+            return self.root
+        self.root = Node(None, 3 - brd.player, None, brd.free_cols(), None)
+        self.root_board = brd.copy()
+        return self.root
+
+    # Run one selection, expansion, simulation and backpropagation step.
+    #
+    # PARAM [Node]                root:    the root of the tree
+    # PARAM [windows.WindowTable] table:   the windows of the board shape
+    # PARAM [list of int]         masks:   the token masks of the root position
+    # PARAM [list of int]         heights: the column heights of the root position
+    # PARAM [int]                 empty:   the number of empty cells at the root
+    def iterate(self, root, table, masks, heights, empty):
+        """Grows the tree by one node and scores it with rollouts"""
+        h = table.h
+        masks = masks[:]
+        heights = heights[:]
+        node = root
+        # Selection: follow the best UCT child down to a node with untried moves
+        while not node.untried and node.children:
+            node = self.select(node)
+            x = node.move
+            masks[node.player] |= 1 << (x * (h + 1) + heights[x])
+            heights[x] += 1
+            empty -= 1
+        # Expansion: add one of the untried moves
+        if node.untried:
+            x = node.untried.pop(random.randrange(len(node.untried)))
+            p = 3 - node.player
+            y = heights[x]
+            m = masks[p] | (1 << (x * (h + 1) + y))
+            masks[p] = m
+            heights[x] = y + 1
+            empty -= 1
+            winner = None
+            for wi in table.windows_at(x, y):
+                if m & table.masks[wi] == table.masks[wi]:
+                    winner = p
+                    break
+            if winner is None and empty == 0:
+                winner = 0
+            untried = []
+            if winner is None:
+                untried = [c for c in range(table.w) if heights[c] < h]
+            child = Node(x, p, node, untried, winner)
+            node.children.append(child)
+            node = child
+        # Simulation
+        if node.winner is not None:
+            results = [0, 0, 0]
+            results[node.winner] = 1
+        elif self.pool is not None:
+            shape = (table.w, table.h, table.n)
+            tasks = [(shape, masks, heights, 3 - node.player, empty,
+                      self.leaf_rollouts, random.getrandbits(32))
+                     for i in range(self.workers)]
+            results = [0, 0, 0]
+            for r in self.pool.map(rollout_batch, tasks):
+                for i in range(3):
+                    results[i] += r[i]
+        elif self.batch_rollouts > 0:
+            results = self.batch_rollout(table, masks, heights, 3 - node.player)
+        else:
+            results = [0, 0, 0]
+            results[rollout(table, masks, heights, 3 - node.player, empty, random)] = 1
+        count = sum(results)
+        self.move_playouts += count
+        # Backpropagation
+        while node is not None:
+            node.visits += count
+            node.score += results[node.player] + 0.5 * results[0]
+            node = node.parent
+
+    # Play the rollouts of a leaf with the NumPy playout engine.
+    #
+    # PARAM [windows.WindowTable] table:   the windows of the board shape
+    # PARAM [list of int]         masks:   the token masks of the leaf
+    # PARAM [list of int]         heights: the column heights of the leaf
+    # PARAM [int]                 player:  the player to move at the leaf [1|2]
+    # RETURN [list of int]: the number of ties, wins of Player 1 and wins of Player 2
+    def batch_rollout(self, table, masks, heights, player):
+        """Plays batch_rollouts random games from a leaf at once"""
+        shape = (table.w, table.h, table.n)
+        if shape not in self.engines:
+            self.engines[shape] = batch_playout.PlayoutEngine(*shape, seed=random.getrandbits(32))
+        engine = self.engines[shape]
+        h = table.h
+        grid = [[0] * table.w for y in range(h)]
+        for x in range(table.w):
+            for y in range(heights[x]):
+                grid[y][x] = 1 if masks[1] >> (x * (h + 1) + y) & 1 else 2
+        engine.reset(self.batch_rollouts, grid, player)
+        engine.run()
+        return engine.results()
+
+    # Pick the child to explore with the UCT formula.
+    #
+    # PARAM [Node] node: a fully expanded node
+    # RETURN [Node]: the child with the highest upper confidence bound
+    def select(self, node):
+        """Returns the child maximizing the UCT score"""
+        c = self.exploration * math.sqrt(math.log(node.visits))
+        best = None
+        best_value = -1.0
+        for child in node.children:
+            value = child.score / child.visits + c / math.sqrt(child.visits)
+            if value > best_value:
+                best = child
+                best_value = value
+        return best
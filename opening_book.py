@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+
+import mmap
+import multiprocessing
+import os
+import struct
+import sys
+import time
+
+import board
+
+################
+# Opening Book #
+################
+
+# A book file holds the best moves of early positions for any number of board
+# shapes. It starts with a header and one directory record per shape, followed
+# by the entries of each shape, sorted by key so they can be binary searched.
+#
+# Positions are keyed by the smaller of Board.key() and Board.mirror_key(), so
+# that a position and its left-right mirror share one entry; the move is stored
+# for that canonical side.
+
+# Header: magic, number of shapes
+MAGIC = b"CNBOOK01"
+HEADER = struct.Struct("<8sI")
+# Shape record: width, height, tokens to win, padding, offset of the first
+# entry in the file, number of entries
+SHAPE = struct.Struct("<HHHHQQ")
+# Entry: canonical key, move, depth of the search that chose it
+ENTRY = struct.Struct("<QHH")
+
+class OpeningBook(object):
+    """Read-only opening book, looked up in place through mmap"""
+
+    # Class constructor.
+    #
+    # PARAM [string] path: the book file
+    def __init__(self, path):
+        """Class constructor"""
+        self.path = path
+        self.file = open(path, "rb")
+        # Only the header is read; entries are paged in by the lookups
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError("Not an opening book: {}".format(path))
+        # Offset and number of entries, indexed by board shape (w, h, n)
+        self.shapes = {}
+        for i in range(count):
+            w, h, n, pad, offset, entries = SHAPE.unpack_from(self.data, HEADER.size + i * SHAPE.size)
+            self.shapes[(w, h, n)] = (offset, entries)
+
+    # Close the file.
+    def close(self):
+        """Releases the mapping and the file"""
+        self.data.close()
+        self.file.close()
+
+    # Find an entry by key.
+    #
+    # PARAM [(int, int, int)] shape: the board shape (w, h, n)
+    # PARAM [int]             key:   the canonical key of the position
+    # RETURN [(int, int)]: the move and depth of the entry, or None if the
+    #                      position is not in the book
+    def find(self, shape, key):
+        """Binary searches the entries of a board shape for a key"""
+        if shape not in self.shapes:
+            return None
+        offset, hi = self.shapes[shape]
+        lo = 0
+        while lo < hi:
+            mid = (lo + hi) // 2
+            k, move, depth = ENTRY.unpack_from(self.data, offset + mid * ENTRY.size)
+            if k == key:
+                return move, depth
+            if k < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return None
+
+    # Look up the book move of a position.
+    #
+    # PARAM [board.Board] brd: the current board state
+    # RETURN [int]: the column to play, or None if the position is not in the book
+    def lookup(self, brd):
+        """Returns the book move for the given board, or None"""
+        key, mirrored = canonical_key(brd)
+        entry = self.find((brd.w, brd.h, brd.n), key)
+        if entry is None:
+            return None
+        move = entry[0]
+        if mirrored:
+            move = brd.w - 1 - move
+        # Never trust the book with an illegal move
+        if move >= brd.w or brd.heights[move] >= brd.h:
+            return None
+        return move
+
+    # Get all the entries of a board shape.
+    #
+    # PARAM [(int, int, int)] shape: the board shape (w, h, n)
+    # RETURN [list of (int, int, int)]: the key, move and depth of every entry
+    def entries(self, shape):
+        """Returns the entries of a board shape"""
+        if shape not in self.shapes:
+            return []
+        offset, count = self.shapes[shape]
+        return [ENTRY.unpack_from(self.data, offset + i * ENTRY.size) for i in range(count)]
+
+# Get the symmetry-canonical key of a position.
+#
+# PARAM [board.Board] brd: the board
+# RETURN [(int, bool)]: the smaller of the key and the mirrored key, and
+#                       whether it is the mirrored one
+def canonical_key(brd):
+    """Returns the key shared by a position and its mirror image"""
+    key = brd.key()
+    mkey = brd.mirror_key()
+    if mkey < key:
+        return mkey, True
+    return key, False
+
+# Write a book file.
+#
+# PARAM [string] path: the book file
+# PARAM [dict]   book: lists of (key, move, depth) entries, indexed by board
+#                      shape (w, h, n)
+def write_book(path, book):
+    """Saves the entries of every board shape, sorted by key"""
+    shapes = sorted(book)
+    offset = HEADER.size + len(shapes) * SHAPE.size
+    header = HEADER.pack(MAGIC, len(shapes))
+    records = []
+    blobs = []
+    for shape in shapes:
+        # One entry per key, keeping the deepest search
+        entries = {}
+        for key, move, depth in book[shape]:
+            if key not in entries or entries[key][1] < depth:
+                entries[key] = (move, depth)
+        records.append(SHAPE.pack(shape[0], shape[1], shape[2], 0, offset, len(entries)))
+        blob = b"".join(ENTRY.pack(key, entries[key][0], entries[key][1]) for key in sorted(entries))
+        blobs.append(blob)
+        offset = offset + len(blob)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(header)
+        f.write(b"".join(records))
+        f.write(b"".join(blobs))
+    os.replace(tmp, path)
+
+##################
+# Book Generator #
+##################
+
+# List the positions to put in the book.
+#
+# PARAM [int] w: the board width
+# PARAM [int] h: the board height
+# PARAM [int] n: the number of tokens to line up to win
+# PARAM [int] plies: the number of tokens of the deepest positions
+# RETURN [list of list of int]: the moves leading to every position with at
+#                               most plies tokens and no winner, one per
+#                               mirror pair
+def book_positions(w, h, n, plies):
+    """Enumerates the distinct early positions of a board shape"""
+    positions = []
+    seen = set()
+    level = [[]]
+    for ply in range(plies + 1):
+        following = []
+        for moves in level:
+            brd = board.Board([[0] * w for i in range(h)], w, h, n)
+            for x in moves:
+                brd.play(x)
+            key = canonical_key(brd)[0]
+            if key in seen or brd.get_outcome() != 0 or not brd.free_cols():
+                continue
+            seen.add(key)
+            positions.append(moves)
+            following.extend(moves + [x] for x in brd.free_cols())
+        level = following
+    return positions
+
+# The agent of a generator process
+_agent = None
+
+# Set up a generator process.
+#
+# PARAM [int]   depth:      the maximum search depth
+# PARAM [float] time_limit: the time limit of a search in seconds
+def init_generator(depth, time_limit):
+    global _agent
+    import alpha_beta_agent
+    _agent = alpha_beta_agent.AlphaBetaAgent("book", depth, iterative=True, time_limit=time_limit,
+                                             time_fraction=1.0, endgame_cells=0, endgame_nodes=0)
+
+# Search a book position.
+#
+# PARAM [(int, int, int, list of int)] task: the board shape and the moves
+#                                            leading to the position
+# RETURN [(int, int, int)]: the canonical key, canonical move and search depth
+def search_position(task):
+    w, h, n, moves = task
+    brd = board.Board([[0] * w for i in range(h)], w, h, n)
+    for x in moves:
+        brd.add_token(x)
+    _agent.player = brd.player
+    move = _agent.go(brd.copy())
+    key, mirrored = canonical_key(brd)
+    if mirrored:
+        move = w - 1 - move
+    return key, move, _agent.completed_depth
+
+if __name__ == "__main__":
+    #
+    # Parse arguments
+    #
+    if len(sys.argv) < 7:
+        print("Usage:\n  {} <book file> <plies> <depth> <seconds per position> <processes> <w>x<h>n<n> [...]".format(sys.argv[0]))
+        sys.exit(1)
+
+    BOOK_FILE  = sys.argv[1]
+    PLIES      = int(sys.argv[2])
+    DEPTH      = int(sys.argv[3])
+    TIME_LIMIT = float(sys.argv[4])
+    PROCESSES  = int(sys.argv[5])
+    SHAPES     = []
+    for arg in sys.argv[6:]:
+        size, n = arg.split("n")
+        w, h = size.split("x")
+        SHAPES.append((int(w), int(h), int(n)))
+
+    # Keep the shapes of an existing book that are not rebuilt
+    book = {}
+    if os.path.exists(BOOK_FILE):
+        old = OpeningBook(BOOK_FILE)
+        for shape in old.shapes:
+            if shape not in SHAPES:
+                book[shape] = old.entries(shape)
+        old.close()
+
+    #
+    # Search every position in a process pool
+    #
+    with multiprocessing.Pool(PROCESSES, init_generator, (DEPTH, TIME_LIMIT)) as pool:
+        for w, h, n in SHAPES:
+            tasks = [(w, h, n, moves) for moves in book_positions(w, h, n, PLIES)]
+            print("{}x{}n{}: {} positions".format(w, h, n, len(tasks)))
+            st = time.time()
+            book[(w, h, n)] = []
+            for entry in pool.imap_unordered(search_position, tasks):
+                book[(w, h, n)].append(entry)
+                done = len(book[(w, h, n)])
+                if done % 100 == 0 or done == len(tasks):
+                    print("  {}/{} ({:.0f}s)".format(done, len(tasks), time.time() - st))
+
+    write_book(BOOK_FILE, book)
+    print(BOOK_FILE, "written")
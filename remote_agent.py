@@ -0,0 +1,238 @@
+import multiprocessing
+import multiprocessing.util
+import os
+import signal
+import time
+import weakref
+import agent
+import board
+
+# CPU clock ticks per second, for reading /proc
+_CLK_TCK = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+# The RemoteAgents created by the harness, whose own time verdict the Game
+# trusts. Agents are free to build RemoteAgents too, with any limits.
+_trusted = weakref.WeakSet()
+
+# Mark a RemoteAgent as created by the harness (run_match.get_agent()).
+#
+# PARAM [RemoteAgent] player: the wrapper
+# RETURN [RemoteAgent]: the same wrapper
+def trust(player):
+    """Lets the Game use the time verdict of a wrapper"""
+    _trusted.add(player)
+    return player
+
+# Check whether a RemoteAgent was created by the harness.
+#
+# PARAM [agent.Agent] player: the agent
+# RETURN [bool]: True if the Game can use player.overran
+def trusted(player):
+    """Returns True for the wrappers passed to trust()"""
+    return player in _trusted
+
+# Get the CPU time used by a process group.
+#
+# PARAM [int] pgid: the process group id, which is the pid of its leader
+# RETURN [float]: the user and system time of the processes of the group, and
+#                 of the children they waited for, in seconds
+#
+# NOTE: A process that leaves the group, or whose parent left it, is no
+#       longer counted. The leader is counted even before it has made its
+#       own group.
+def cpu_seconds(pgid):
+    """Returns the CPU time used so far by a process group, read from /proc"""
+    ticks = 0
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open("/proc/{}/stat".format(entry)) as f:
+                stat = f.read()
+        except OSError:
+            # The process ended meanwhile
+            continue
+        # The command name may hold spaces, so count fields after it
+        fields = stat[stat.rindex(")") + 2:].split()
+        if int(fields[2]) == pgid or int(entry) == pgid:
+            ticks += int(fields[11]) + int(fields[12]) + int(fields[13]) + int(fields[14])
+    return ticks / _CLK_TCK
+
+# Main loop of an agent process.
+#
+# PARAM [agent.Agent]                     player: the agent
+# PARAM [multiprocessing.connection.Connection] conn: the pipe to the Game side
+def serve(player, conn):
+    # Own process group, so that the processes the agent starts are killed
+    # along with it
+    if hasattr(os, "setpgrp"):
+        os.setpgrp()
+    while True:
+        msg = conn.recv()
+        if msg is None:
+            # Let the agent stop its own processes
+            if hasattr(player, "close"):
+                player.close()
+            return
+        if msg[0] == "go":
+            grid, w, h, n, p, limit = msg[1:]
+            brd = board.Board(grid, w, h, n)
+            brd.player = p
+            player.player = p
+            player.time_limit = limit
+            try:
+                x = player.go(board.BoardView(brd))
+            except Exception as e:
+                print(player.name, "failed:", repr(e))
+                x = None
+            conn.send(x)
+        elif msg[0] == "move":
+            player.move_played(msg[1], msg[2])
+        elif msg[0] == "over":
+            player.game_over(msg[1])
+
+################
+# Remote Agent #
+################
+
+class RemoteAgent(agent.Agent):
+    """Runs another agent in a child process, with a hard time limit per move"""
+
+    # Class constructor.
+    #
+    # PARAM [agent.Agent] player:      the agent to run
+    # PARAM [bool]        cpu_time:    if True, limit the CPU time of the agent
+    #                                  process and the processes it starts,
+    #                                  instead of the wall time
+    # PARAM [float]       wall_factor: in CPU time mode, the wall time limit as
+    #                                  a multiple of the time limit, so that a
+    #                                  blocked agent still loses
+    #
+    # NOTE: The agent process is started on the first move and kept for the
+    #       following moves and games. It is forked, so it starts from the
+    #       state the agent has at that time. It is not daemonic, so that the
+    #       agent can start processes of its own.
+    def __init__(self, player, cpu_time=False, wall_factor=4):
+        super().__init__(player.name)
+        self.agent = player
+        self.cpu_time = cpu_time
+        self.wall_factor = wall_factor
+        self.proc = None
+        self.conn = None
+        # True if the last move ran out of time; the Game reads it instead of
+        # its own measurement, which includes the pipe
+        self.overran = False
+        # Stop the agent process on exit, before multiprocessing waits for it
+        multiprocessing.util.Finalize(self, self.close, exitpriority=10)
+
+    # Start the agent process, if not running.
+    def start(self):
+        """Starts the agent process"""
+        if self.proc is not None:
+            if self.proc.is_alive():
+                return
+            # The agent process died
+            self.kill()
+        self.conn, child = multiprocessing.Pipe()
+        self.proc = multiprocessing.Process(target=serve, args=(self.agent, child))
+        self.proc.start()
+        child.close()
+
+    # Kill the agent process; a new one is started on the next move.
+    def kill(self):
+        """Stops the agent process at once"""
+        try:
+            os.killpg(self.proc.pid, signal.SIGKILL)
+        except (AttributeError, OSError):
+            # No process group of its own (yet)
+            self.proc.kill()
+        self.proc.join()
+        self.conn.close()
+        self.proc = None
+        self.conn = None
+
+    # Stop the agent process.
+    def close(self):
+        """Stops the agent process"""
+        if self.proc is None:
+            return
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.proc.join(5)
+        # Also takes down anything left in its process group
+        self.kill()
+
+    # Pick a column, in the agent process.
+    #
+    # PARAM [board.Board] brd: the current board state
+    # RETURN [int]: the column where the token must be added, or None if the
+    #               agent ran out of time or failed
+    def go(self, brd):
+        """Asks the agent process for a move, and kills it at the time limit"""
+        self.start()
+        self.overran = False
+        limit = self.time_limit
+        self.conn.send(("go", brd.board, brd.w, brd.h, brd.n, brd.player, limit))
+        if limit is None:
+            ready = True
+        elif not self.cpu_time:
+            ready = self.conn.poll(limit)
+        else:
+            ready = self.wait_cpu(limit)
+        if not ready:
+            self.overran = True
+            self.kill()
+            return None
+        try:
+            return self.conn.recv()
+        except EOFError:
+            # The agent process died
+            self.kill()
+            return None
+
+    # Wait for a move while the agent process has CPU time left.
+    #
+    # PARAM [float] limit: the CPU time limit in seconds
+    # RETURN [Bool]: True if the move arrived in time
+    def wait_cpu(self, limit):
+        """Waits until the move arrives or the CPU or wall time runs out"""
+        # The agent process leads the group of the processes it starts
+        pid = self.proc.pid
+        start = cpu_seconds(pid)
+        deadline = time.monotonic() + limit * self.wall_factor
+        while True:
+            left = limit - (cpu_seconds(pid) - start)
+            wall_left = deadline - time.monotonic()
+            if left <= 0 or wall_left <= 0:
+                # One last look, in case the move came in meanwhile
+                return self.conn.poll(0)
+            # Look often: the processes of the group use CPU time together
+            if self.conn.poll(min(left, wall_left, 0.05)):
+                return True
+
+    # Be told about a move played in the game.
+    #
+    # PARAM [int] x:      the column where the token was added
+    # PARAM [int] player: the player who added the token [1|2]
+    def move_played(self, x, player):
+        self.tell(("move", x, player))
+
+    # Be told that the game is over.
+    #
+    # PARAM [int] outcome: 1 for Player 1, 2 for Player 2, and 0 for no winner
+    def game_over(self, outcome):
+        self.tell(("over", outcome))
+
+    # Send a message to the agent process, if running.
+    #
+    # PARAM [tuple] msg: the message
+    def tell(self, msg):
+        if self.proc is None:
+            return
+        try:
+            self.conn.send(msg)
+        except OSError:
+            # The agent process died; it is started again on the next move
+            pass
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+
+import hashlib
+import inspect
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+#################
+# Results Store #
+#################
+
+# One row per game, unique per board shape and ordered pair of players. A
+# player is the name of its entry in PLAYERS; the agent name is the one the
+# game log shows. hash1 and hash2 identify the code of the agents, so that
+# games of changed agents are played again.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS games (
+    id         INTEGER PRIMARY KEY,
+    width      INTEGER NOT NULL,
+    height     INTEGER NOT NULL,
+    tokens     INTEGER NOT NULL,
+    player1    TEXT NOT NULL,
+    player2    TEXT NOT NULL,
+    name1      TEXT NOT NULL,
+    name2      TEXT NOT NULL,
+    hash1      TEXT NOT NULL,
+    hash2      TEXT NOT NULL,
+    time_limit REAL NOT NULL,
+    outcome    INTEGER NOT NULL,
+    forfeit    INTEGER NOT NULL,
+    played     REAL NOT NULL,
+    UNIQUE (width, height, tokens, player1, player2)
+);
+CREATE TABLE IF NOT EXISTS moves (
+    game    INTEGER NOT NULL REFERENCES games (id),
+    ply     INTEGER NOT NULL,
+    col     INTEGER,
+    seconds REAL,
+    PRIMARY KEY (game, ply)
+) WITHOUT ROWID;
+"""
+
+# Get a hash of the code of an agent.
+#
+# PARAM [agent.Agent] player: the agent
+# RETURN [string]: the SHA-1 of the source file of the agent class, or of
+#                  the agent a RemoteAgent runs
+def code_hash(player):
+    """Returns a hash that changes when the agent source changes"""
+    player = getattr(player, "agent", player)
+    try:
+        source = Path(inspect.getsourcefile(type(player))).read_bytes()
+    except (TypeError, OSError):
+        # Built without a source file
+        return ""
+    return hashlib.sha1(source).hexdigest()
+
+# Read a game log written by game.Game.logged_go().
+#
+# PARAM [string] path: the log file
+# RETURN [(string, string, int, bool, list of (int, float))]: the agent
+#        names, the outcome, whether the game was forfeited, and the moves
+#        with no thinking time; None if the log has no header
+#
+# NOTE: A forfeited game logs no outcome and not the move that lost it, which
+#       is read back as a move of unknown column.
+def read_log(path):
+    """Parses a .dat game log"""
+    lines = Path(path).read_text().splitlines()
+    if len(lines) < 2:
+        return None
+    name1 = lines[0].rsplit(" ", 1)[0]
+    name2 = lines[1].rsplit(" ", 1)[0]
+    moves = []
+    for line in lines[2:]:
+        last = line.rsplit(" ", 1)[1]
+        if last == "tie":
+            return name1, name2, 0, False, moves
+        if last == "wins":
+            # The winner made the last move
+            return name1, name2, 2 - len(moves) % 2, False, moves
+        moves.append((int(last), None))
+    # The player to move forfeited
+    outcome = 2 - len(moves) % 2
+    moves.append((None, None))
+    return name1, name2, outcome, True, moves
+
+class ResultsDB(object):
+    """SQLite store of tournament games"""
+
+    # Class constructor.
+    #
+    # PARAM [string] path: the database file, created if missing
+    def __init__(self, path):
+        """Class constructor"""
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=60)
+        # Readers do not block the writer, and commits only wait for the log
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    # Close the database.
+    def close(self):
+        """Closes the connection"""
+        self.conn.close()
+
+    # Get the games already played on a board shape.
+    #
+    # PARAM [int] w: the board width
+    # PARAM [int] h: the board height
+    # PARAM [int] n: the number of tokens to line up to win
+    # RETURN [dict]: the code hashes of both agents, indexed by (player1, player2)
+    def played(self, w, h, n):
+        """Returns the pairs of players with a stored game"""
+        rows = self.conn.execute("SELECT player1, player2, hash1, hash2 FROM games "
+                                 "WHERE width = ? AND height = ? AND tokens = ?", (w, h, n))
+        return {(p1, p2): (h1, h2) for p1, p2, h1, h2 in rows}
+
+    # Store games, all in one transaction.
+    #
+    # PARAM [list of tuple] games: the width, height, tokens, player1, player2,
+    #                              name1, name2, hash1, hash2, time limit,
+    #                              outcome, forfeit flag and list of
+    #                              (column, seconds) moves of every game
+    #
+    # NOTE: A stored game of the same shape and players is replaced.
+    def add(self, games):
+        """Inserts games with their moves"""
+        with self.conn:
+            for g in games:
+                key = g[:5]
+                self.conn.execute("DELETE FROM moves WHERE game IN (SELECT id FROM games WHERE "
+                                  "width = ? AND height = ? AND tokens = ? AND player1 = ? AND player2 = ?)", key)
+                self.conn.execute("DELETE FROM games WHERE "
+                                  "width = ? AND height = ? AND tokens = ? AND player1 = ? AND player2 = ?", key)
+                cur = self.conn.execute("INSERT INTO games (width, height, tokens, player1, player2, name1, name2, "
+                                        "hash1, hash2, time_limit, outcome, forfeit, played) "
+                                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                        g[:11] + (int(g[11]), time.time()))
+                game_id = cur.lastrowid
+                self.conn.executemany("INSERT INTO moves (game, ply, col, seconds) VALUES (?, ?, ?, ?)",
+                                      [(game_id, i, x if isinstance(x, int) else None, t)
+                                       for i, (x, t) in enumerate(g[12])])
+
+    # Write the stored games as game logs, in the format of game.Game.logged_go().
+    #
+    # PARAM [string] datadir: the directory of the logs
+    # PARAM [tuple]  shape:   only export this (w, h, n) board shape, if given
+    # RETURN [int]: the number of logs written
+    def export(self, datadir, shape=None):
+        """Writes a <w>_<h>_<n>_<player1>_<player2>.dat file per game"""
+        query = ("SELECT id, width, height, tokens, player1, player2, name1, name2, outcome, forfeit "
+                 "FROM games")
+        args = ()
+        if shape is not None:
+            query = query + " WHERE width = ? AND height = ? AND tokens = ?"
+            args = tuple(shape)
+        count = 0
+        for game_id, w, h, n, p1, p2, name1, name2, outcome, forfeit in self.conn.execute(query, args).fetchall():
+            cols = [x for (x,) in self.conn.execute("SELECT col FROM moves WHERE game = ? ORDER BY ply", (game_id,))]
+            names = (name1, name2)
+            file_path = "{}/{}_{}_{}_{}_{}.dat".format(datadir, w, h, n, p1, p2)
+            with Path(file_path).open("w") as log:
+                log.write("{} player1\n".format(name1))
+                log.write("{} player2\n".format(name2))
+                # The move that lost a forfeited game is not logged
+                if forfeit:
+                    cols = cols[:-1]
+                for i, x in enumerate(cols):
+                    log.write("{} {}\n".format(names[i % 2], x))
+                if not forfeit:
+                    if outcome == 0:
+                        log.write("- tie\n")
+                    else:
+                        log.write("{} wins\n".format(names[outcome - 1]))
+            count = count + 1
+        return count
+
+if __name__ == "__main__":
+    #
+    # Parse arguments
+    #
+    if not len(sys.argv) in [3,6]:
+        print("Usage:\n  {} <database> <datadir> [<board width> <board height> <tokens to win>]".format(sys.argv[0]))
+        sys.exit(1)
+
+    DATABASE = sys.argv[1]
+    DATADIR  = sys.argv[2]
+    SHAPE    = None
+    if len(sys.argv) == 6:
+        SHAPE = (int(sys.argv[3]), int(sys.argv[4]), int(sys.argv[5]))
+
+    #
+    # Export the games as .dat logs
+    #
+    db = ResultsDB(DATABASE)
+    print(db.export(DATADIR, SHAPE), "games exported to", DATADIR)
+    db.close()
@@ -4,40 +4,88 @@ import sys
 from pathlib import Path
 
 import game
+import remote_agent
 from players import PLAYERS
 
-#
-# Parse arguments
-#
-if not len(sys.argv) in [8,9]:
-    print("Usage:\n  {} <datadir> <board width> <board height> <tokens to win> <time limit> <player1> <player2> [replay]".format(sys.argv))
-    sys.exit(1)
-
-DATADIR      = sys.argv[1]
-BOARD_WIDTH  = int(sys.argv[2])
-BOARD_HEIGHT = int(sys.argv[3])
-TOKENS       = int(sys.argv[4])
-TIME_LIMIT   = int(sys.argv[5])
-PLAYER1      = sys.argv[6]
-PLAYER2      = sys.argv[7]
-REPLAY       = (len(sys.argv) == 9 and sys.argv[8] == "replay")
+# Agents wrapped in a RemoteAgent, by player name. They are kept from one
+# match to the next, so that their process stays warm.
+_remote = {}
 
+# Get the agent of a player.
 #
-# Make file name and check if it exists
-#
-FILE_PATH = "{}/{}_{}_{}_{}_{}.dat".format(DATADIR, BOARD_WIDTH, BOARD_HEIGHT, TOKENS, PLAYER1, PLAYER2)
-if(Path(FILE_PATH).exists() and (not REPLAY)):
-    print(FILE_PATH, "skipped")
-    sys.exit(0)
-print(FILE_PATH, "started")
+# PARAM [string] name:     the name of the player in PLAYERS
+# PARAM [bool]   remote:   if True, run the agent in a child process that is
+#                          killed when it runs out of time
+# PARAM [bool]   cpu_time: with remote, limit the CPU time of the agent
+#                          instead of its wall time
+# RETURN [agent.Agent]: the agent
+def get_agent(name, remote=False, cpu_time=False):
+    """Returns the agent of PLAYERS, wrapped in a RemoteAgent if asked"""
+    if not remote:
+        return PLAYERS[name]
+    if name not in _remote:
+        _remote[name] = remote_agent.trust(remote_agent.RemoteAgent(PLAYERS[name], cpu_time))
+    return _remote[name]
 
+# Play one logged match.
 #
-# Time to play!
+# PARAM [string] datadir:  the directory of the match logs
+# PARAM [int]    width:    the board width
+# PARAM [int]    height:   the board height
+# PARAM [int]    tokens:   the number of tokens to line up to win
+# PARAM [int]    limit:    the time limit per move in seconds
+# PARAM [string] p1:       the name of Player 1 in PLAYERS
+# PARAM [string] p2:       the name of Player 2 in PLAYERS
+# PARAM [bool]   replay:   if True, play the match even if its log exists
+# PARAM [bool]   remote:   see get_agent()
+# PARAM [bool]   cpu_time: see get_agent()
+# RETURN [game.Game]: the finished game, or None if the match was skipped
 #
-g = game.Game(BOARD_WIDTH,      # width
-              BOARD_HEIGHT,     # height
-              TOKENS,           # tokens in a row to win
-              PLAYERS[PLAYER1], # player 1
-              PLAYERS[PLAYER2]) # player 2
-g.logged_go(FILE_PATH, TIME_LIMIT)
-print(FILE_PATH, "done")
+# NOTE: The agents of PLAYERS are shared by all the matches played in a
+#       process, so they keep their state from one match to the next.
+def play_match(datadir, width, height, tokens, limit, p1, p2, replay=False, remote=False, cpu_time=False):
+    """Plays p1 against p2 and logs the game, unless it was already played"""
+    #
+    # Make file name and check if it exists
+    #
+    file_path = "{}/{}_{}_{}_{}_{}.dat".format(datadir, width, height, tokens, p1, p2)
+    if(Path(file_path).exists() and (not replay)):
+        print(file_path, "skipped")
+        return None
+    print(file_path, "started")
+
+    #
+    # Time to play!
+    #
+    g = game.Game(width,                          # width
+                  height,                         # height
+                  tokens,                         # tokens in a row to win
+                  get_agent(p1, remote, cpu_time), # player 1
+                  get_agent(p2, remote, cpu_time)) # player 2
+    g.logged_go(file_path, limit)
+    print(file_path, "done")
+    return g
+
+if __name__ == "__main__":
+    #
+    # Parse arguments
+    #
+    # replay: play the match even if its log exists
+    # remote: run the agents in child processes, killed at the time limit
+    # cpu:    same as remote, limiting CPU time instead of wall time
+    if len(sys.argv) < 8 or not set(sys.argv[8:]) <= {"replay", "remote", "cpu"}:
+        print("Usage:\n  {} <datadir> <board width> <board height> <tokens to win> <time limit> <player1> <player2> [replay] [remote|cpu]".format(sys.argv))
+        sys.exit(1)
+
+    DATADIR      = sys.argv[1]
+    BOARD_WIDTH  = int(sys.argv[2])
+    BOARD_HEIGHT = int(sys.argv[3])
+    TOKENS       = int(sys.argv[4])
+    TIME_LIMIT   = int(sys.argv[5])
+    PLAYER1      = sys.argv[6]
+    PLAYER2      = sys.argv[7]
+    REPLAY       = ("replay" in sys.argv[8:])
+    CPU_TIME     = ("cpu" in sys.argv[8:])
+    REMOTE       = ("remote" in sys.argv[8:]) or CPU_TIME
+
+    play_match(DATADIR, BOARD_WIDTH, BOARD_HEIGHT, TOKENS, TIME_LIMIT, PLAYER1, PLAYER2, REPLAY, REMOTE, CPU_TIME)
@@ -1,12 +1,28 @@
 #!/usr/bin/env python3
 
-import multiprocessing
+import json
 import os
+import random
 import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from subprocess import call
 from players import PLAYERS
+import results_db
+import run_match
 
-def run_match(params):
+# Set up a worker process.
+def init_worker():
+    # Forked workers would otherwise all draw the same random numbers
+    random.seed()
+
+# Play a match in a fresh interpreter.
+#
+# PARAM [tuple] params: see run_match_worker()
+# RETURN [tuple]: see run_match_worker(); the moves are read back from the
+#                 match log, with no thinking time
+def run_match_process(params):
     datadir = params[0]
     width   = params[1]
     height  = params[2]
@@ -14,26 +30,211 @@ def run_match(params):
     limit   = params[4]
     p1      = params[5]
     p2      = params[6]
-    call(["python3", "run_match.py", datadir, str(width), str(height), str(tokens), str(limit), p1, p2])
+    flags   = ["replay"]
+    if params[8]:
+        flags.append("cpu")
+    elif params[7]:
+        flags.append("remote")
+    st = time.time()
+    status = call(["python3", "run_match.py", datadir, str(width), str(height), str(tokens), str(limit), p1, p2] + flags)
+    result = None
+    if status == 0:
+        file_path = "{}/{}_{}_{}_{}_{}.dat".format(datadir, width, height, tokens, p1, p2)
+        log = results_db.read_log(file_path)
+        if log is not None:
+            # The thinking time of the players is not known here
+            result = log + (None,)
+    return params, result, time.time() - st
+
+# Play a match in the worker, with the agents it already has loaded.
+#
+# PARAM [tuple] params: the arguments of run_match.play_match() up to p2,
+#                       then its remote and cpu_time arguments
+# RETURN [(tuple, tuple, float)]: the params, the result and the time the
+#                                 match took in seconds. The result holds the
+#                                 agent names, outcome, forfeit flag, moves
+#                                 and thinking time of each player, or is
+#                                 None if the match could not be played.
+def run_match_worker(params):
+    st = time.time()
+    result = None
+    try:
+        # The results store decides which matches to play
+        g = run_match.play_match(*params[:7], replay=True, remote=params[7], cpu_time=params[8])
+        result = (g.players[0].name, g.players[1].name, g.outcome, g.forfeit, g.moves, g.think_time)
+    except Exception:
+        # An agent failing to move forfeits in the Game. Other errors, such
+        # as one in move_played(), leave the match unstored, so it is played
+        # again when the tournament is resumed.
+        traceback.print_exc()
+    return params, result, time.time() - st
+
+##############
+# Match Cost #
+##############
 
+# Load the match costs measured by previous runs.
 #
-# Parse arguments
+# PARAM [string] path: the cost file
+# RETURN [dict]: the seconds an agent thinks in a game, indexed by board
+#                shape then agent name
+def load_costs(path):
+    """Returns the stored costs, or no costs if there is no cost file"""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+# Save the match costs.
+#
+# PARAM [string] path:  the cost file
+# PARAM [dict]   costs: see load_costs()
+def save_costs(path, costs):
+    """Replaces the cost file"""
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(costs, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+# Estimate the time a match takes.
 #
-if not len(sys.argv) == 6:
-    print("Usage:\n  {} <datadir> <board width> <board height> <tokens to win> <time limit>".format(sys.argv))
-    sys.exit(1)
-
-DATADIR      = sys.argv[1]
-BOARD_WIDTH  = int(sys.argv[2])
-BOARD_HEIGHT = int(sys.argv[3])
-TOKENS       = int(sys.argv[4])
-TIME_LIMIT   = int(sys.argv[5])
-
-pool = multiprocessing.Pool()
-matches = []
-for p1 in PLAYERS.keys():
-    for p2 in PLAYERS.keys():
-        if p1 != p2:
-            matches.append((p1,p2))
-
-procs = pool.map(run_match, [(DATADIR, BOARD_WIDTH, BOARD_HEIGHT, TOKENS, TIME_LIMIT, m[0], m[1]) for m in matches])
+# PARAM [dict]   costs: the costs of one board shape, indexed by agent name
+# PARAM [string] p1:    the name of Player 1
+# PARAM [string] p2:    the name of Player 2
+# RETURN [float]: the estimated seconds
+#
+# NOTE: Agents never measured are assumed as slow as the slowest known one,
+#       so that they run early.
+def match_cost(costs, p1, p2):
+    """Returns the summed game cost of both players"""
+    default = max(costs.values(), default=1.0)
+    return costs.get(p1, default) + costs.get(p2, default)
+
+# Store the time the players of a match took.
+#
+# PARAM [dict]   costs:   the costs of one board shape, indexed by agent name
+# PARAM [string] p1:      the name of Player 1
+# PARAM [string] p2:      the name of Player 2
+# PARAM [list]   think:   the thinking time of each player, or None
+# PARAM [float]  elapsed: the time the match took in seconds
+def update_costs(costs, p1, p2, think, elapsed):
+    """Averages the measured time into the cost of each player"""
+    for i, p in enumerate((p1, p2)):
+        if think is not None:
+            t = think[i]
+        else:
+            # Without stats, both players are charged half the match
+            t = elapsed / 2
+        if p in costs:
+            t = (costs[p] + t) / 2
+        costs[p] = t
+
+# Format a number of seconds.
+def hms(seconds):
+    seconds = int(seconds)
+    return "{}:{:02d}:{:02d}".format(seconds // 3600, seconds // 60 % 60, seconds % 60)
+
+if __name__ == "__main__":
+    #
+    # Parse arguments
+    #
+    if len(sys.argv) < 6 or not set(sys.argv[6:]) <= {"isolated", "remote", "cpu"}:
+        print("Usage:\n  {} <datadir> <board width> <board height> <tokens to win> <time limit> [isolated] [remote|cpu]".format(sys.argv))
+        sys.exit(1)
+
+    DATADIR      = sys.argv[1]
+    BOARD_WIDTH  = int(sys.argv[2])
+    BOARD_HEIGHT = int(sys.argv[3])
+    TOKENS       = int(sys.argv[4])
+    TIME_LIMIT   = int(sys.argv[5])
+    # Start a new interpreter for every match, for agents that cannot be reused
+    ISOLATED     = ("isolated" in sys.argv[6:])
+    # Run the agents in child processes that are killed at the time limit, so
+    # that a hung agent cannot block a worker; "cpu" limits CPU time instead
+    # of wall time
+    CPU_TIME     = ("cpu" in sys.argv[6:])
+    REMOTE       = ("remote" in sys.argv[6:]) or CPU_TIME
+    # Costs of every agent and board shape, kept across runs
+    COST_FILE    = "{}/costs.json".format(DATADIR)
+    SHAPE        = "{}x{}n{}".format(BOARD_WIDTH, BOARD_HEIGHT, TOKENS)
+    # Results, written as the matches finish: players, outcome and seconds
+    RESULT_FILE  = "{}/{}_{}_{}_results.txt".format(DATADIR, BOARD_WIDTH, BOARD_HEIGHT, TOKENS)
+
+    # Games played, kept across runs so that a tournament can be resumed
+    DATABASE     = "{}/results.db".format(DATADIR)
+    # Games are stored in batches of this many, or after this many seconds
+    BATCH_SIZE   = 32
+    BATCH_TIME   = 10.0
+
+    #
+    # Skip the matches already stored for the current code of both agents
+    #
+    db = results_db.ResultsDB(DATABASE)
+    hashes = {p: results_db.code_hash(PLAYERS[p]) for p in PLAYERS.keys()}
+    stored = db.played(BOARD_WIDTH, BOARD_HEIGHT, TOKENS)
+    matches = []
+    for p1 in PLAYERS.keys():
+        for p2 in PLAYERS.keys():
+            if p1 != p2 and stored.get((p1, p2)) != (hashes[p1], hashes[p2]):
+                matches.append((p1,p2))
+    print("{} matches to play, {} already played".format(len(matches), len(PLAYERS) * (len(PLAYERS) - 1) - len(matches)))
+
+    #
+    # Longest matches first, so that no slow match is left alone at the end
+    #
+    all_costs = load_costs(COST_FILE)
+    costs = all_costs.setdefault(SHAPE, {})
+    estimate = {m: match_cost(costs, m[0], m[1]) for m in matches}
+    matches.sort(key=lambda m: estimate[m], reverse=True)
+
+    run = run_match_worker
+    if ISOLATED:
+        run = run_match_process
+
+    # Workers are forked after PLAYERS is imported, and play all their matches
+    # in-process. Unlike multiprocessing.Pool, they are not daemonic, so the
+    # agents can start processes of their own.
+    pool = ProcessPoolExecutor(initializer=init_worker)
+    total = sum(estimate.values())
+    done = 0.0
+    st = time.time()
+    batch = []
+    flushed = time.time()
+    try:
+        with open(RESULT_FILE, "a") as results:
+            jobs = [(DATADIR, BOARD_WIDTH, BOARD_HEIGHT, TOKENS, TIME_LIMIT, m[0], m[1], REMOTE, CPU_TIME)
+                    for m in matches]
+            # Jobs are handed out in the order they are submitted
+            futures = [pool.submit(run, job) for job in jobs]
+            for i, future in enumerate(as_completed(futures)):
+                params, result, elapsed = future.result()
+                p1, p2 = params[5], params[6]
+                done = done + estimate[(p1, p2)]
+                if result is None:
+                    # Not stored, so played again when the tournament is resumed
+                    print(p1, "vs.", p2, "failed")
+                else:
+                    name1, name2, outcome, forfeit, moves, think = result
+                    update_costs(costs, p1, p2, think, elapsed)
+                    batch.append((BOARD_WIDTH, BOARD_HEIGHT, TOKENS, p1, p2, name1, name2, hashes[p1], hashes[p2],
+                                  TIME_LIMIT, outcome, forfeit, moves))
+                    results.write("{} {} {} {:.2f}\n".format(p1, p2, outcome, elapsed))
+                    results.flush()
+                if len(batch) >= BATCH_SIZE or time.time() - flushed > BATCH_TIME:
+                    db.add(batch)
+                    save_costs(COST_FILE, all_costs)
+                    batch = []
+                    flushed = time.time()
+                # Progress and estimated time left
+                spent = time.time() - st
+                eta = "?"
+                if done > 0:
+                    eta = hms(spent * (total - done) / done)
+                print("[{}/{}] {} elapsed, ETA {}".format(i + 1, len(jobs), hms(spent), eta), flush=True)
+    finally:
+        # Keep the finished games, even if the tournament is interrupted
+        db.add(batch)
+        save_costs(COST_FILE, all_costs)
+        db.close()
+        pool.shutdown(cancel_futures=True)
@@ -0,0 +1,73 @@
+import random
+
+import board
+import endgame
+
+# Solve a position by trying every line of play.
+#
+# PARAM [board.Board] brd:  the position, with no winner yet
+# PARAM [dict]        memo: results already known, indexed by masks
+# RETURN [int]: WIN, DRAW or LOSS for the player to move
+def brute_force(brd, memo):
+    key = (brd.masks[1], brd.masks[2])
+    if key in memo:
+        return memo[key]
+    cols = brd.free_cols()
+    best = endgame.DRAW if not cols else endgame.LOSS
+    for x in cols:
+        brd.play(x)
+        if brd.get_outcome() != 0:
+            v = endgame.WIN
+        else:
+            v = -brute_force(brd, memo)
+        brd.undo()
+        best = max(best, v)
+        if best == endgame.WIN:
+            break
+    memo[key] = best
+    return best
+
+# Build a random position with no winner and at least one free column.
+#
+# PARAM [random.Random] rng:    the random generator
+# PARAM [int]           w, h, n: the board shape
+# PARAM [int]           tokens: the number of tokens to play
+# RETURN [board.Board]: the position, or None if the game ended on the way
+def random_position(rng, w, h, n, tokens):
+    brd = board.Board([[0] * w for i in range(h)], w, h, n)
+    for i in range(tokens):
+        brd.play(rng.choice(brd.free_cols()))
+        if brd.get_outcome() != 0:
+            return None
+    if not brd.free_cols():
+        return None
+    return brd
+
+def check_shape(w, h, n, min_tokens, count):
+    rng = random.Random(w * 100 + h * 10 + n)
+    solver = endgame.EndgameSolver(1 << 16)
+    memo = {}
+    checked = 0
+    while checked < count:
+        brd = random_position(rng, w, h, n, rng.randint(min_tokens, w * h - 1))
+        if brd is None:
+            continue
+        result, move = solver.solve(brd.copy())
+        assert result == brute_force(brd, memo)
+        # The move must achieve the result
+        assert move in brd.free_cols()
+        brd.play(move)
+        if brd.get_outcome() != 0:
+            assert result == endgame.WIN
+        else:
+            assert -brute_force(brd, memo) == result
+        checked += 1
+
+def test_3x3n3():
+    check_shape(3, 3, 3, 0, 80)
+
+def test_4x4n3():
+    check_shape(4, 4, 3, 0, 100)
+
+def test_5x4n4():
+    check_shape(5, 4, 4, 4, 60)
@@ -0,0 +1,74 @@
+import random
+
+import alpha_beta_agent
+import board
+import evaluator
+
+# Score the tokens of a player with the original per-cell scan: every token
+# looks n-1 cells away in all 8 directions (AlphaBetaAgent.tokenScore()).
+#
+# PARAM [alpha_beta_agent.AlphaBetaAgent] agent: the agent holding tokenScore()
+# PARAM [board.Board]                     brd:   the board
+# PARAM [int]                             t:     the player [1|2]
+# RETURN [int]: the summed score of the tokens of player t
+def scan_score(agent, brd, t):
+    score = 0
+    for y in range(brd.h):
+        for x in range(brd.w):
+            if brd.board[y][x] == t:
+                score += agent.tokenScore(brd, x, y, t)
+    return score
+
+# Check the incremental evaluator and AlphaBetaAgent.get_board_score(), both
+# built on the window tables, against the per-cell scan, and the running
+# counts against a new evaluator built from the same board.
+#
+# PARAM [alpha_beta_agent.AlphaBetaAgent] agent: the reference scorer
+# PARAM [board.Board]                     brd:   the board
+# PARAM [evaluator.IncrementalEvaluator]  ev:    the evaluator following brd
+def check(agent, brd, ev):
+    scores = [0, scan_score(agent, brd, 1), scan_score(agent, brd, 2)]
+    for p in (1, 2):
+        assert ev.score(p) == scores[p] - scores[3 - p]
+        assert agent.get_board_score(brd, p, 3 - p) == scores[p] - scores[3 - p]
+    fresh = evaluator.IncrementalEvaluator(brd)
+    assert ev.scores == fresh.scores
+    assert ev.threats == fresh.threats
+    assert ev.open_windows == fresh.open_windows
+
+def test_play_undo_matches_full_score():
+    rng = random.Random(1)
+    agent = alpha_beta_agent.AlphaBetaAgent("ref", 1)
+    positions = 0
+    for game in range(60):
+        w = rng.randint(3, 8)
+        h = rng.randint(3, 7)
+        n = rng.randint(3, max(w, h))
+        brd = board.Board([[0] * w for i in range(h)], w, h, n)
+        ev = evaluator.IncrementalEvaluator(brd)
+        initial = (list(ev.scores), list(ev.threats), list(ev.open_windows))
+        played = []
+        # Random walk of plays and undos, going deeper on average
+        for step in range(3 * w * h):
+            if played and (not brd.free_cols() or rng.random() < 0.3):
+                x = played.pop()
+                brd.undo()
+                ev.undo(x, brd.heights[x])
+            else:
+                x = rng.choice(brd.free_cols())
+                y = brd.play(x)
+                ev.play(x, y, brd.board[y][x])
+                played.append(x)
+            check(agent, brd, ev)
+            positions += 1
+        # Take every token back
+        while played:
+            x = played.pop()
+            brd.undo()
+            ev.undo(x, brd.heights[x])
+        assert (ev.scores, ev.threats, ev.open_windows) == initial
+        assert not any(ev.cells)
+        for p in (1, 2):
+            assert not any(ev.counts[p])
+            assert not any(ev.contribs[p])
+    assert positions > 1000
@@ -15,13 +15,19 @@ import alpha_beta_agent as aba
 # PARAM [int]         l:  the time limit for a move in seconds
 # PARAM [agent.Agent] p1: the agent for Player 1
 # PARAM [agent.Agent] p2: the agent for Player 2
-def play_game(w, h, n, l, p1, p2):
+# PARAM [dict]        stats: if given, the thinking time and number of moves
+#                            of each agent are added to it
+def play_game(w, h, n, l, p1, p2, stats=None):
     g = game.Game(w,  # width
                   h,  # height
                   n,  # tokens in a row to win
                   p1, # player 1
                   p2) # player 2
     o = g.timed_go(l)
+    if stats is not None:
+        for i, p in enumerate((p1, p2)):
+            (t, m) = stats.get(p, (0.0, 0))
+            stats[p] = (t + g.think_time[i], m + g.moves_made[i])
     print("    GAME:", p1.name, "vs.", p2.name, ": ", end='')
     if o == 0:
         print("tie")
@@ -44,11 +50,12 @@ def play_game(w, h, n, l, p1, p2):
 # PARAM [int]         l:  the time limit for a move in seconds
 # PARAM [agent.Agent] p1: the agent for Player 1
 # PARAM [agent.Agent] p2: the agent for Player 2
-def play_match(w, h, n, l, p1, p2):
+# PARAM [dict]        stats: see play_game()
+def play_match(w, h, n, l, p1, p2, stats=None):
     print("  MATCH:", p1.name, "vs.", p2.name)
     # Play the games
-    o1 = play_game(w, h, n, l, p1, p2)
-    o2 = play_game(w, h, n, l, p2, p1)
+    o1 = play_game(w, h, n, l, p1, p2, stats)
+    o2 = play_game(w, h, n, l, p2, p1, stats)
     # Calculate scores
     s1 = 0
     s2 = 0
@@ -79,14 +86,15 @@ def play_match(w, h, n, l, p1, p2):
 # PARAM [list of agent.Agent] ps: the agents in the tournament
 def play_tournament(w, h, n, l, ps):
     print("TOURNAMENT START")
-    # Initialize scores
+    # Initialize scores and thinking times
     scores = {}
+    stats = {}
     for p in ps:
         scores[p] = 0
     # Play
     for i in range(0, len(ps)-1):
         for j in range(i + 1, len(ps)):
-            (s1, s2) = play_match(w, h, n, l, ps[i], ps[j])
+            (s1, s2) = play_match(w, h, n, l, ps[i], ps[j], stats)
             scores[ps[i]] = scores[ps[i]] + s1
             scores[ps[j]] = scores[ps[j]] + s2
     print("TOURNAMENT END")
@@ -95,6 +103,12 @@ def play_tournament(w, h, n, l, ps):
     print("\nSCORES:")
     for v,k in sscores:
         print(v,k)
+    # Print the average thinking time, to weigh strength against speed
+    print("\nTIME PER MOVE:")
+    for p in ps:
+        (t, m) = stats.get(p, (0.0, 0))
+        if m > 0:
+            print("{:.3f}s".format(t / m), p.name)
 
 #######################
 # Run the tournament! #
@@ -106,6 +120,7 @@ random.seed(1)
 # Construct list of agents in the tournament
 agents = [
     # aba.AlphaBetaAgent("aba", 4),
+    # aba.AlphaBetaAgent("aba_lmr", 6, lmr=True),
     agent.RandomAgent("random1"),
     agent.RandomAgent("random2"),
     agent.RandomAgent("random3"),
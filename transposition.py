@@ -0,0 +1,161 @@
+import struct
+
+#######################
+# Transposition Table #
+#######################
+
+# Bound types of a stored value
+EXACT = 0
+LOWER = 1
+UPPER = 2
+
+# Each entry is three 64-bit words: check, value (as a double), and meta.
+# The check word is key ^ value bits ^ meta, so that an entry torn by a
+# concurrent writer simply fails to match instead of returning garbage.
+ENTRY_WORDS = 3
+ENTRY_BYTES = 8 * ENTRY_WORDS
+
+# Meta word layout: depth (8 bits), bound (8 bits), move + 1 (16 bits),
+# generation (16 bits), plus a flag marking the entry as used
+VALID = 1 << 62
+
+# Conversion of the value word to a double, in the byte order of the buffer
+WORD = struct.Struct("=Q")
+DOUBLE = struct.Struct("=d")
+
+class TranspositionTable(object):
+    """Fixed-size transposition table with two-tier buckets"""
+
+    # Class constructor.
+    #
+    # PARAM [int]    size: the memory budget in bytes
+    # PARAM [buffer] buf:  the memory to store the entries in; if None, a new
+    #                      zeroed buffer is allocated. It must be at least
+    #                      TranspositionTable.buffer_size(size) bytes long.
+    #
+    # NOTE: Every bucket holds two entries: the first one is only replaced by
+    #       searches at least as deep (or from an older search), the second
+    #       one is always replaced.
+    def __init__(self, size, buf=None):
+        """Class constructor"""
+        # Number of buckets
+        self.buckets = max(1, size // (2 * ENTRY_BYTES))
+        if buf is None:
+            buf = bytearray(TranspositionTable.buffer_size(size))
+        # Views of the same memory as bytes, unsigned words and doubles
+        self.bytes = memoryview(buf).cast('B')
+        self.words = memoryview(buf).cast('B').cast('Q')
+        self.values = memoryview(buf).cast('B').cast('d')
+        # Search generation, bumped for every new root search
+        self.generation = 0
+        # Statistics
+        self.hits = 0
+        self.misses = 0
+        self.collisions = 0
+
+    # Get the number of bytes needed to store a table.
+    #
+    # PARAM [int] size: the memory budget in bytes
+    # RETURN [int]: the size of the buffer used for that budget
+    @staticmethod
+    def buffer_size(size):
+        """Returns the buffer size in bytes for the given memory budget"""
+        return max(1, size // (2 * ENTRY_BYTES)) * 2 * ENTRY_BYTES
+
+    # Empty the table and reset the statistics.
+    def clear(self):
+        """Removes all the entries"""
+        self.bytes[:] = bytes(len(self.bytes))
+        self.generation = 0
+        self.reset_stats()
+
+    # Release the views of the buffer, so that shared memory can be closed.
+    def release(self):
+        """Stops using the buffer"""
+        self.bytes.release()
+        self.words.release()
+        self.values.release()
+
+    # Reset the hit/miss/collision counters.
+    def reset_stats(self):
+        """Resets the statistics"""
+        self.hits = 0
+        self.misses = 0
+        self.collisions = 0
+
+    # Start a new root search; older entries become replaceable.
+    #
+    # PARAM [int] generation: the generation of the new search; if None, the
+    #                         current generation is bumped
+    def new_search(self, generation=None):
+        """Sets or bumps the search generation"""
+        if generation is None:
+            generation = self.generation + 1
+        self.generation = generation & 0xFFFF
+
+    # Look a position up.
+    #
+    # PARAM [int] key: the 64-bit key of the position
+    # RETURN [(float, int, int, int, int)]: the value, depth, bound type, best
+    #                                       move (None if unknown) and search
+    #                                       generation of the entry, or None
+    #                                       if the position is not stored
+    def probe(self, key):
+        """Returns the entry stored for the given key, or None"""
+        words = self.words
+        i = (key % self.buckets) * 2 * ENTRY_WORDS
+        for j in (i, i + ENTRY_WORDS):
+            meta = words[j + 2]
+            if not meta & VALID:
+                continue
+            # The value word is read once, so that the value returned is
+            # the one the check word was matched against
+            vbits = words[j + 1]
+            if words[j] ^ vbits ^ meta == key:
+                self.hits += 1
+                move = ((meta >> 16) & 0xFFFF) - 1
+                if move < 0:
+                    move = None
+                return (DOUBLE.unpack(WORD.pack(vbits))[0], meta & 0xFF, (meta >> 8) & 0xFF,
+                        move, (meta >> 32) & 0xFFFF)
+            self.collisions += 1
+        self.misses += 1
+        return None
+
+    # Store a position.
+    #
+    # PARAM [int]   key:   the 64-bit key of the position
+    # PARAM [float] value: the value of the position
+    # PARAM [int]   depth: the depth searched below the position
+    # PARAM [int]   bound: EXACT, LOWER or UPPER
+    # PARAM [int]   move:  the best move found, or None
+    def store(self, key, value, depth, bound, move):
+        """Stores an entry, replacing the least useful one in its bucket"""
+        words = self.words
+        i = (key % self.buckets) * 2 * ENTRY_WORDS
+        # Depth-preferred entry: keep it unless it is shallower, stale or the same position
+        meta = words[i + 2]
+        if (meta & VALID and ((meta >> 32) & 0xFFFF) == self.generation and
+            (meta & 0xFF) > depth and words[i] ^ words[i + 1] ^ meta != key):
+            # Fall back to the always-replace entry
+            i = i + ENTRY_WORDS
+        if move is None:
+            move = -1
+        meta = (VALID | (self.generation << 32) | ((move + 1) << 16) |
+                (bound << 8) | depth)
+        # The check word is built from the bits written here, never read
+        # back, so that a concurrent writer cannot pair this key with its value
+        vbits = WORD.unpack(DOUBLE.pack(value))[0]
+        words[i + 1] = vbits
+        words[i + 2] = meta
+        words[i] = key ^ vbits ^ meta
+
+    # Get the hit rate of the probes.
+    #
+    # RETURN [float]: the fraction of probes that found their position
+    def hit_rate(self):
+        """Returns the fraction of successful probes"""
+        probes = self.hits + self.misses
+        if probes == 0:
+            return 0.0
+        return self.hits / probes
@@ -0,0 +1,86 @@
+from array import array
+
+#########################
+# Winning window tables #
+#########################
+
+# A window is a set of n aligned cells, that is, a place where a player could
+# line up n tokens. Cells are numbered row-major: cell (x,y) is y*w+x.
+
+# Memoized window tables, indexed by board shape (w, h, n)
+_tables = {}
+
+class WindowTable(object):
+    """All the length-n windows of a board shape, and the windows through each cell"""
+
+    # Class constructor.
+    #
+    # PARAM [int] w: the board width
+    # PARAM [int] h: the board height
+    # PARAM [int] n: the number of tokens to line up to win
+    def __init__(self, w, h, n):
+        """Class constructor"""
+        self.w = w
+        self.h = h
+        self.n = n
+        # Cells of every window, n consecutive entries per window, from one
+        # end of the window to the other
+        self.cells = array('H')
+        # Mask of every window, in the bit layout of board.Board
+        self.masks = []
+        # Horizontal, vertical, diagonal up, diagonal down. A single cell is
+        # the same window in every direction, so only keep one then.
+        directions = ((1, 0), (0, 1), (1, 1), (1, -1))
+        if n == 1:
+            directions = directions[:1]
+        for dx, dy in directions:
+            for y in range(h):
+                for x in range(w):
+                    # Is the window inside the board?
+                    ex = x + (n - 1) * dx
+                    ey = y + (n - 1) * dy
+                    if ex >= w or ey < 0 or ey >= h:
+                        continue
+                    mask = 0
+                    for i in range(n):
+                        cx = x + i * dx
+                        cy = y + i * dy
+                        self.cells.append(cy * w + cx)
+                        mask |= 1 << (cx * (h + 1) + cy)
+                    self.masks.append(mask)
+        # Number of windows
+        self.count = len(self.masks)
+        # Windows through every cell: those of cell i are
+        # index[offsets[i]:offsets[i+1]]
+        through = [[] for i in range(w * h)]
+        for wi in range(self.count):
+            for c in self.cells[wi * n:(wi + 1) * n]:
+                through[c].append(wi)
+        self.offsets = array('I', [0])
+        self.index = array('I')
+        for ws in through:
+            self.index.extend(ws)
+            self.offsets.append(len(self.index))
+
+    # Get the windows that contain a cell.
+    #
+    # PARAM [int] x: the x coordinate of the cell
+    # PARAM [int] y: the y coordinate of the cell
+    # RETURN [array of int]: the indices of the windows through (x,y)
+    def windows_at(self, x, y):
+        """Returns the indices of the windows containing cell (x,y)"""
+        c = y * self.w + x
+        return self.index[self.offsets[c]:self.offsets[c + 1]]
+
+# Get the window table of a board shape.
+#
+# PARAM [int] w: the board width
+# PARAM [int] h: the board height
+# PARAM [int] n: the number of tokens to line up to win
+# RETURN [windows.WindowTable]: the (memoized) window table
+def window_table(w, h, n):
+    """Returns the (memoized) window table for a board shape"""
+    shape = (w, h, n)
+    if shape not in _tables:
+        _tables[shape] = WindowTable(w, h, n)
+    return _tables[shape]